@@ -0,0 +1,6 @@
+"""Small helpers shared by the trade converter scripts; importing this module has no side effects."""
+
+
+def map_unique(series, func):
+    """Apply `func` once per distinct value and map the results back to every row"""
+    return series.map({value: func(value) for value in series.dropna().unique()})
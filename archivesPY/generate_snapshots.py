@@ -3,6 +3,8 @@ Holdings Snapshot Generator
 Creates year-end snapshots of portfolio holdings for faster calculation
 Includes cash flows for XIRR calculation and stores year-end market prices
 """
+import functools
+import numpy as np
 import pandas as pd
 from datetime import datetime, date
 import os
@@ -16,12 +18,65 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from price_fetcher import fetch_historical_price, fetch_sgb_price
 
+# Use the multi-threaded pyarrow CSV parser (and the Parquet tradebook) when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
+# Use the C-implemented orjson for the cash-flows file when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Snapshot files are written through one large buffer so each lands in a few big writes
+SNAPSHOT_WRITE_BUFFER_BYTES = 1 << 20
+
 # Suppress warnings
 warnings.filterwarnings('ignore', message='urllib3 v2 only supports OpenSSL 1.1.1+')
 warnings.filterwarnings('ignore', category=FutureWarning)
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
 
+def load_tradebook(tradebook_file='archivesCSV/tradebook.csv'):
+    """
+    Load the tradebook with parsed dates and upper-case trade types.
+    Prefers the typed tradebook.parquet written by tradebook_builder, as long as it is
+    at least as new as the CSV (a manual edit or sort_tradebook run makes it stale).
+    Parsed tradebooks are memoized on the files' modification times, so repeated
+    calls in one process only re-read after the tradebook changes.
+    """
+    parquet_file = os.path.splitext(tradebook_file)[0] + '.parquet'
+    csv_mtime = os.stat(tradebook_file).st_mtime_ns
+    try:
+        parquet_mtime = os.stat(parquet_file).st_mtime_ns
+    except OSError:
+        parquet_mtime = None
+    
+    # Hand out a copy so callers can't modify the cached frame
+    return _load_tradebook_cached(os.path.abspath(tradebook_file), csv_mtime, parquet_mtime).copy()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_tradebook_cached(tradebook_file, csv_mtime, parquet_mtime):
+    """Parse the tradebook; cached by load_tradebook on (path, mtimes)."""
+    if pyarrow is not None and parquet_mtime is not None and parquet_mtime >= csv_mtime:
+        parquet_file = os.path.splitext(tradebook_file)[0] + '.parquet'
+        df = pd.read_parquet(parquet_file, engine='pyarrow')
+    else:
+        df = pd.read_csv(tradebook_file, engine=CSV_ENGINE, parse_dates=['Date'], date_format='%Y-%m-%d')
+    
+    df['Type'] = df['Type'].str.upper()
+    
+    # Repeated strings as categories: compact, and compared/grouped by integer code
+    for column in ('Ticker', 'Type', 'Currency'):
+        df[column] = df[column].astype('category')
+    return df
+
+
 def get_sgb_price_at_date(ticker, target_date):
     """
     Fetch SGB price from NSE (current price as approximation)
@@ -49,6 +104,58 @@ def get_historical_price(ticker, target_date, currency='INR', is_sgb=False):
     return price
 
 
+def calculate_fifo_position(ticker_trades):
+    """
+    Vectorized FIFO (First In First Out) matching for a single ticker.
+    Sells consume the earliest buy lots first, so after all trades each lot keeps
+    whatever part of it lies beyond the total quantity consumed. Working with cumulative
+    buy/sell quantities gives the same matching as walking the lots one by one, so there
+    is no lot queue here (the parallel-array lot store with a head pointer lives in
+    portfolio_calculator's FIFO kernels, which still walk trades one at a time).
+    
+    Args:
+        ticker_trades: Trades of one ticker, sorted by Date with BUYs before SELLs on the same date
+    
+    Returns:
+        (avg_buy_price, realized_profit) - weighted average price of the remaining
+        lots, and realized profit of the matched quantity in the trade currency
+    """
+    qty = ticker_trades['Qty'].to_numpy(dtype=float)
+    price = ticker_trades['Price'].to_numpy(dtype=float)
+    trade_type = ticker_trades['Type'].to_numpy()
+    is_buy = trade_type == 'BUY'
+    is_sell = trade_type == 'SELL'
+    
+    buy_qty, buy_price = qty[is_buy], price[is_buy]
+    sell_qty, sell_price = qty[is_sell], price[is_sell]
+    
+    # Cumulative quantity at the end of each buy lot
+    buy_end = np.cumsum(buy_qty)
+    total_bought = buy_end[-1] if len(buy_end) else 0.0
+    
+    # A sell can only consume lots bought up to that point; any excess is dropped.
+    # Consumed quantity follows P_k = min(P_(k-1) + sell_k, bought_by_k), which unrolls
+    # to the running sold quantity plus the running minimum of (bought - sold).
+    sold_to_date = np.cumsum(sell_qty)
+    bought_by_sell = np.cumsum(np.where(is_buy, qty, 0.0))[is_sell]
+    consumed = sold_to_date + np.minimum(np.minimum.accumulate(bought_by_sell - sold_to_date), 0.0)
+    total_consumed = consumed[-1] if len(consumed) else 0.0
+    remaining = np.clip(buy_end - total_consumed, 0, buy_qty)
+    
+    # Weighted average of remaining lots
+    total_qty = remaining.sum()
+    avg_buy_price = (remaining * buy_price).sum() / total_qty if total_qty > 0 else 0
+    
+    # Realized profit matches every sell against all buy lots of the ticker in FIFO order,
+    # up to the total quantity bought
+    total_sold = sold_to_date[-1] if len(sold_to_date) else 0.0
+    matched_sell_qty = np.diff(np.minimum(sold_to_date, total_bought), prepend=0.0)
+    matched_buy_qty = buy_qty - np.clip(buy_end - total_sold, 0, buy_qty)
+    realized_profit = (matched_sell_qty * sell_price).sum() - (matched_buy_qty * buy_price).sum()
+    
+    return avg_buy_price, float(realized_profit)
+
+
 def calculate_fifo_avg_price(ticker_trades):
     """
     Calculate average buy price using FIFO (First In First Out) method.
@@ -57,42 +164,46 @@ def calculate_fifo_avg_price(ticker_trades):
     """
     # CRITICAL: Sort trades by date, then by Type (BUY before SELL on same date)
     # This ensures BUYs are processed before SELLs when they occur on the same day
-    ticker_trades = ticker_trades.copy()
-    ticker_trades['Type_Sort'] = ticker_trades['Type'].map({'BUY': 0, 'SELL': 1})
-    ticker_trades = ticker_trades.sort_values(['Date', 'Type_Sort']).reset_index(drop=True)
-    
-    # Create a list of buy lots (each with qty and price) in chronological order
-    buy_lots = []
-    
-    # Process ALL trades in chronological order
-    for _, row in ticker_trades.iterrows():
-        if row['Type'] == 'BUY':
-            # Add new buy lot
-            buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-        elif row['Type'] == 'SELL':
-            # Match sell against earliest remaining buy lots (FIFO)
-            sell_qty_remaining = row['Qty']
-            
-            for lot in buy_lots:
-                if sell_qty_remaining <= 0:
-                    break
-                    
-                if lot['qty'] > 0:
-                    qty_to_reduce = min(lot['qty'], sell_qty_remaining)
-                    lot['qty'] -= qty_to_reduce
-                    sell_qty_remaining -= qty_to_reduce
-    
-    # Calculate weighted average of remaining lots
-    total_qty = sum(lot['qty'] for lot in buy_lots if lot['qty'] > 0)
-    total_value = sum(lot['qty'] * lot['price'] for lot in buy_lots if lot['qty'] > 0)
-    
-    if total_qty > 0:
-        return total_value / total_qty
-    else:
-        return 0
+    ticker_trades = ticker_trades.assign(Type_Sort=(ticker_trades['Type'].values == 'SELL').astype(np.int8))
+    ticker_trades = ticker_trades.sort_values(['Date', 'Type_Sort'], kind='mergesort')
+    
+    avg_buy_price, _ = calculate_fifo_position(ticker_trades)
+    return avg_buy_price
+
+
+def group_trades_by_ticker(df):
+    """
+    Sort the tradebook once and split it per ticker, so every year's snapshot
+    can reuse the same groups instead of re-filtering and re-sorting all trades.
+    
+    Args:
+        df: Full tradebook dataframe
+    
+    Returns:
+        List of (ticker, ticker_trades, trade_dates) tuples, with ticker_trades sorted
+        by Date (BUYs before SELLs on the same date) and trade_dates as a NumPy array
+    """
+    # CRITICAL: Sort trades by date, then by Type (BUY before SELL on same date)
+    # This ensures BUYs are processed before SELLs when they occur on the same day.
+    df = df.assign(Type_Sort=(df['Type'].values == 'SELL').astype(np.int8))
+    df = df.sort_values(['Ticker', 'Date', 'Type_Sort'], kind='mergesort')
+    
+    # Cash flow of every trade for XIRR (in INR): BUYs are outflows, SELLs inflows
+    trade_type = df['Type'].values
+    is_buy = trade_type == 'BUY'
+    is_sell = trade_type == 'SELL'
+    sign = np.where(is_buy, -1.0, 1.0)
+    df['Cash_Flow'] = sign * df['Qty'].values * df['Price'].values * df['Exchange_Rate'].values
+    df['Cash_Flow_Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+    df['Is_Cash_Flow'] = is_buy | is_sell
+    
+    return [
+        (ticker, ticker_trades, ticker_trades['Date'].to_numpy())
+        for ticker, ticker_trades in df.groupby('Ticker', sort=False, observed=True)
+    ]
 
 
-def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
+def generate_snapshot_for_year(df, year, output_dir='archivesCSV', ticker_groups=None):
     """
     Generate a holdings snapshot as of December 31st of the given year
     
@@ -100,54 +211,61 @@ def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
         df: Full tradebook dataframe
         year: Year to generate snapshot for (e.g., 2022, 2023, etc.)
         output_dir: Directory to save snapshot files
+        ticker_groups: Optional result of group_trades_by_ticker(df), shared across years
     
     Returns:
         Path to the created snapshot file
     """
-    # Filter trades up to and including December 31st of the year
+    if ticker_groups is None:
+        ticker_groups = group_trades_by_ticker(df)
+    
+    # Take each ticker's trades up to and including December 31st of the year.
+    # Trades are sorted by date, so this is a leading slice of every group.
     cutoff_date = pd.Timestamp(f'{year}-12-31 23:59:59')
-    df_filtered = df[df['Date'] <= cutoff_date].copy()
+    year_groups = []
+    for ticker, ticker_trades, trade_dates in ticker_groups:
+        trade_count = np.searchsorted(trade_dates, np.datetime64(cutoff_date), side='right')
+        if trade_count > 0:
+            year_groups.append((ticker, ticker_trades.iloc[:trade_count]))
+    
+    total_trades = sum(len(ticker_trades) for _, ticker_trades in year_groups)
     
-    if df_filtered.empty:
+    if total_trades == 0:
         print(f"⚠️  No trades found up to {year}-12-31. Skipping snapshot.")
         return None
     
     print(f"📅 Generating snapshot for year {year}...")
-    print(f"   Processing {len(df_filtered)} trades up to {year}-12-31")
-    
-    # Get unique tickers
-    ticker_list = df_filtered['Ticker'].unique().tolist()
-    
-    snapshot_data = []
+    print(f"   Processing {total_trades} trades up to {year}-12-31")
+    
+    # Snapshot columns, filled row by row for tickers still held at year-end
+    max_rows = len(year_groups)
+    tickers = []
+    currencies = []
+    qty_arr = np.empty(max_rows)
+    avg_arr = np.empty(max_rows)
+    invested_arr = np.empty(max_rows)
+    realized_arr = np.empty(max_rows)
+    fx_arr = np.empty(max_rows)
+    sgb_arr = np.empty(max_rows, dtype=bool)
+    price_arr = np.full(max_rows, np.nan)
     holdings_count = 0
     total_realized_profit = 0.0
     
     # Collect ALL cash flows up to this year (for XIRR calculation)
-    all_cash_flows = []
-    all_cash_flow_dates = []
+    year_trades = pd.concat([ticker_trades for _, ticker_trades in year_groups])
+    is_cash_flow = year_trades['Is_Cash_Flow']
+    all_cash_flows = year_trades['Cash_Flow'][is_cash_flow].tolist()
+    all_cash_flow_dates = year_trades['Cash_Flow_Date'][is_cash_flow].tolist()
     
-    for ticker in ticker_list:
-        ticker_trades = df_filtered[df_filtered['Ticker'] == ticker]
-        
+    for ticker, ticker_trades in year_groups:
         # Calculate buy and sell quantities
-        buy_qty = ticker_trades[ticker_trades['Type'] == 'BUY']['Qty'].sum()
-        sell_qty = ticker_trades[ticker_trades['Type'] == 'SELL']['Qty'].sum()
+        buy_qty = ticker_trades['Qty'][ticker_trades['Type'] == 'BUY'].sum()
+        sell_qty = ticker_trades['Qty'][ticker_trades['Type'] == 'SELL'].sum()
         current_qty = buy_qty - sell_qty
         
         # Get currency and exchange rate (use the most recent one for this ticker)
-        currency = ticker_trades['Currency'].iloc[-1]
-        fx_rate = ticker_trades['Exchange_Rate'].iloc[-1]
-        
-        # Add this ticker's cash flows to the total
-        for _, trade in ticker_trades.iterrows():
-            if trade['Type'] == 'BUY':
-                cash_flow = -(trade['Qty'] * trade['Price'] * trade['Exchange_Rate'])
-                all_cash_flows.append(cash_flow)
-                all_cash_flow_dates.append(trade['Date'].strftime('%Y-%m-%d'))
-            elif trade['Type'] == 'SELL':
-                cash_flow = trade['Qty'] * trade['Price'] * trade['Exchange_Rate']
-                all_cash_flows.append(cash_flow)
-                all_cash_flow_dates.append(trade['Date'].strftime('%Y-%m-%d'))
+        currency = ticker_trades['Currency'].iat[-1]
+        fx_rate = ticker_trades['Exchange_Rate'].iat[-1]
         
         # Only include if there are holdings at year-end
         if current_qty < 0.001:
@@ -155,54 +273,17 @@ def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
         
         holdings_count += 1
         
-        # Calculate FIFO average buy price of remaining holdings
-        avg_buy_price = calculate_fifo_avg_price(ticker_trades)
+        # FIFO average buy price of remaining holdings and realized profit, in one pass
+        avg_buy_price, realized_profit = calculate_fifo_position(ticker_trades)
+        realized_profit *= fx_rate
         
         # Calculate total invested amount (in INR)
         invested_amt_inr = float(current_qty) * float(avg_buy_price) * float(fx_rate)
         
-        # Calculate realized profit for this ticker (using FIFO)
-        realized_profit = 0.0
-        buys_only = ticker_trades[ticker_trades['Type'] == 'BUY']
-        sells_only = ticker_trades[ticker_trades['Type'] == 'SELL']
-        
-        if not sells_only.empty and not buys_only.empty:
-            # Sort trades by date for FIFO
-            sorted_trades = ticker_trades.sort_values('Date').reset_index(drop=True)
-            
-            # Track buy lots for FIFO matching
-            buy_lots = []
-            for _, row in sorted_trades.iterrows():
-                if row['Type'] == 'BUY':
-                    buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-            
-            # Match sells against buys using FIFO
-            for _, row in sorted_trades.iterrows():
-                if row['Type'] == 'SELL':
-                    sell_qty_remaining = row['Qty']
-                    sell_price = row['Price']
-                    
-                    # Match this sell against buy lots in FIFO order
-                    for lot in buy_lots:
-                        if sell_qty_remaining <= 0:
-                            break
-                            
-                        if lot['qty'] > 0:
-                            qty_to_match = min(lot['qty'], sell_qty_remaining)
-                            
-                            # Calculate realized profit for this portion
-                            sell_revenue = qty_to_match * sell_price * fx_rate
-                            sell_cost = qty_to_match * lot['price'] * fx_rate
-                            profit = sell_revenue - sell_cost
-                            realized_profit += profit
-                            
-                            lot['qty'] -= qty_to_match
-                            sell_qty_remaining -= qty_to_match
-        
         total_realized_profit += realized_profit
         
         # Check if it's an SGB
-        is_sgb = ticker_trades['Is_SGB'].iloc[-1] if 'Is_SGB' in ticker_trades.columns else False
+        is_sgb = ticker_trades['Is_SGB'].iat[-1] if 'Is_SGB' in ticker_trades.columns else False
         
         # Fetch year-end price for the ticker
         year_end_price = None
@@ -214,24 +295,35 @@ def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
             # For equities, fetch historical price
             year_end_price = get_historical_price(ticker, cutoff_date, currency, is_sgb)
         
-        snapshot_data.append({
-            'Ticker': ticker,
-            'Qty': round(current_qty, 6),
-            'Avg_Buy_Price': round(avg_buy_price, 6),
-            'Total_Invested_INR': round(invested_amt_inr, 2),
-            'Realized_Profit_INR': round(realized_profit, 2),
-            'Currency': currency,
-            'Exchange_Rate': round(fx_rate, 2),
-            'Is_SGB': is_sgb,
-            'Year_End_Price': year_end_price
-        })
-    
-    if not snapshot_data:
+        row = holdings_count - 1
+        tickers.append(ticker)
+        currencies.append(currency)
+        qty_arr[row] = current_qty
+        avg_arr[row] = avg_buy_price
+        invested_arr[row] = invested_amt_inr
+        realized_arr[row] = realized_profit
+        fx_arr[row] = fx_rate
+        sgb_arr[row] = is_sgb
+        if year_end_price is not None:
+            price_arr[row] = year_end_price
+    
+    if holdings_count == 0:
         print(f"⚠️  No holdings found as of {year}-12-31. Skipping snapshot.")
         return None
     
-    # Create DataFrame
-    snapshot_df = pd.DataFrame(snapshot_data)
+    # Create DataFrame straight from the columns
+    n = holdings_count
+    snapshot_df = pd.DataFrame({
+        'Ticker': tickers,
+        'Qty': np.round(qty_arr[:n], 6),
+        'Avg_Buy_Price': np.round(avg_arr[:n], 6),
+        'Total_Invested_INR': np.round(invested_arr[:n], 2),
+        'Realized_Profit_INR': np.round(realized_arr[:n], 2),
+        'Currency': currencies,
+        'Exchange_Rate': np.round(fx_arr[:n], 2),
+        'Is_SGB': sgb_arr[:n],
+        'Year_End_Price': price_arr[:n]
+    })
     
     # Sort by ticker for easier viewing
     snapshot_df = snapshot_df.sort_values('Ticker').reset_index(drop=True)
@@ -241,7 +333,8 @@ def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
     
     # Save holdings to CSV
     output_file = os.path.join(output_dir, f'holdings_snapshot_{year}.csv')
-    snapshot_df.to_csv(output_file, index=False)
+    with open(output_file, 'w', newline='', buffering=SNAPSHOT_WRITE_BUFFER_BYTES) as f:
+        snapshot_df.to_csv(f, index=False)
     
     # Save cash flows to separate JSON file (for XIRR calculation)
     cash_flows_file = os.path.join(output_dir, f'cashflows_snapshot_{year}.json')
@@ -250,11 +343,16 @@ def generate_snapshot_for_year(df, year, output_dir='archivesCSV'):
         'cutoff_date': f'{year}-12-31',
         'cash_flows': all_cash_flows,
         'cash_flow_dates': all_cash_flow_dates,
-        'trade_count': len(df_filtered)
+        'trade_count': total_trades
     }
     
-    with open(cash_flows_file, 'w') as f:
-        json.dump(cash_flows_data, f, indent=2)
+    # Compact JSON (no indentation) - the file is only read back by code
+    if orjson is not None:
+        with open(cash_flows_file, 'wb', buffering=SNAPSHOT_WRITE_BUFFER_BYTES) as f:
+            f.write(orjson.dumps(cash_flows_data, option=orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(cash_flows_file, 'w', buffering=SNAPSHOT_WRITE_BUFFER_BYTES) as f:
+            f.write(json.dumps(cash_flows_data, separators=(',', ':')))
     
     print(f"✅ Snapshot created: {output_file}")
     print(f"   Cash flows saved: {cash_flows_file}")
@@ -287,18 +385,19 @@ def generate_all_snapshots(tradebook_file='archivesCSV/tradebook.csv', start_yea
         return
     
     print(f"📂 Loading {tradebook_file}...")
-    df = pd.read_csv(tradebook_file)
-    df['Date'] = pd.to_datetime(df['Date'])
-    df['Type'] = df['Type'].str.upper()
+    df = load_tradebook(tradebook_file)
     
     print(f"   Loaded {len(df)} total trades")
     print(f"   Date range: {df['Date'].min().date()} to {df['Date'].max().date()}")
     print()
     
+    # Sort and group the trades once; each year only takes a prefix of every ticker
+    ticker_groups = group_trades_by_ticker(df)
+    
     # Generate snapshots for each year
     snapshot_files = []
     for year in range(start_year, end_year + 1):
-        snapshot_file = generate_snapshot_for_year(df, year)
+        snapshot_file = generate_snapshot_for_year(df, year, ticker_groups=ticker_groups)
         if snapshot_file:
             snapshot_files.append(snapshot_file)
     
@@ -326,7 +425,7 @@ def verify_snapshot(snapshot_file):
         print(f"❌ Snapshot file not found: {snapshot_file}")
         return
     
-    df = pd.read_csv(snapshot_file)
+    df = pd.read_csv(snapshot_file, engine=CSV_ENGINE)
     year = snapshot_file.split('_')[-1].replace('.csv', '')
     
     print(f"\n📊 Snapshot Summary for {year}:")
@@ -352,9 +451,7 @@ if __name__ == '__main__':
         elif command == 'single' and len(sys.argv) > 2:
             # Generate snapshot for a single year
             year = int(sys.argv[2])
-            df = pd.read_csv('archivesCSV/tradebook.csv')
-            df['Date'] = pd.to_datetime(df['Date'])
-            df['Type'] = df['Type'].str.upper()
+            df = load_tradebook()
             generate_snapshot_for_year(df, year)
         else:
             print("Usage:")
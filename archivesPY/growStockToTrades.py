@@ -8,28 +8,24 @@ Price is computed as `Value / Quantity` when Value appears to be total trade val
 Ticker suffix is set based on `Exchange` (NSE -> .NS, BSE -> .BO).
 """
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import sys
 
 
-def clean_symbol(sym: str) -> str:
-    if pd.isna(sym):
-        return sym
-    s = str(sym).strip()
+def clean_symbols(symbols: pd.Series) -> pd.Series:
+    """Vectorized symbol cleanup; missing symbols stay missing"""
+    s = symbols.astype(str).str.strip()
     # Remove stray characters often present in exports
-    s = s.replace('$', '').replace(' ', '')
-    return s.upper()
+    s = s.str.replace('$', '', regex=False).str.replace(' ', '', regex=False)
+    return s.str.upper().where(symbols.notna(), symbols)
 
 
-def suffix_for_exchange(exchange: str) -> str:
-    if pd.isna(exchange):
-        return '.NS'
-    e = str(exchange).upper()
-    if 'NSE' in e:
-        return '.NS'
-    if 'BSE' in e:
-        return '.BO'
-    return '.NS'
+def suffixes_for_exchange(exchanges: pd.Series) -> np.ndarray:
+    """Ticker suffix per row: '.BO' for BSE, '.NS' for NSE and anything unknown"""
+    e = exchanges.astype(str).str.upper()
+    is_bse = exchanges.notna() & ~e.str.contains('NSE', regex=False) & e.str.contains('BSE', regex=False)
+    return np.where(is_bse, '.BO', '.NS')
 
 
 def convert(input_path: Path, output_path: Path, overwrite=True):
@@ -60,9 +56,11 @@ def convert(input_path: Path, output_path: Path, overwrite=True):
     out['Date'] = pd.to_datetime(df[date_col], dayfirst=True, errors='coerce').dt.strftime('%Y-%m-%d')
 
     # Symbol -> add exchange suffix
-    df['Symbol_clean'] = df.get('Symbol', df.get('symbol', pd.Series(['']*len(df)))).apply(clean_symbol)
+    df['Symbol_clean'] = clean_symbols(df.get('Symbol', df.get('symbol', pd.Series(['']*len(df)))))
     df['Exchange_clean'] = df.get('Exchange', df.get('exchange', pd.Series(['']*len(df))))
-    out['Ticker'] = df.apply(lambda r: (r['Symbol_clean'] + suffix_for_exchange(r['Exchange_clean'])) if pd.notna(r['Symbol_clean']) else r.get('ISIN', ''), axis=1)
+    ticker = df['Symbol_clean'].fillna('') + suffixes_for_exchange(df['Exchange_clean'])
+    fallback = df['ISIN'] if 'ISIN' in df.columns else ''
+    out['Ticker'] = ticker.where(df['Symbol_clean'].notna(), fallback)
 
     out['Country'] = 'IND'
     out['Type'] = df.get('Type', df.get('type', pd.Series(['']*len(df)))).str.upper()
@@ -1,22 +1,31 @@
 #!/usr/bin/env python3
 import pandas as pd
+from converter_helpers import map_unique
+
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
 
 # Reload the data to ensure state is fresh
-df_2024eq = pd.read_csv("tradebook-BU5086-EQ.csv")
+df_2024eq = pd.read_csv("tradebook-BU5086-EQ.csv", engine=CSV_ENGINE)
 
-# Transform
-df_transformed = df_2024eq.copy()
-df_transformed['Date'] = df_transformed['trade_date']
-df_transformed['Ticker'] = df_transformed['symbol'] + '.NS'
-df_transformed['Country'] = 'IND'
-df_transformed['Type'] = df_transformed['trade_type'].str.upper()
-df_transformed['Qty'] = df_transformed['quantity'].astype(int)
-df_transformed['Price'] = df_transformed['price']
-df_transformed['Currency'] = 'INR'
+# Transform: build only the columns matching trades.csv, in one constructor
+df_final = pd.DataFrame({
+    'Date': df_2024eq['trade_date'],
+    'Ticker': map_unique(df_2024eq['symbol'], lambda symbol: symbol + '.NS'),
+    'Country': 'IND',
+    'Type': map_unique(df_2024eq['trade_type'], str.upper),
+    'Qty': df_2024eq['quantity'].astype('int32'),
+    'Price': df_2024eq['price'],
+    'Currency': 'INR',
+})
 
-# Select columns matching trades.csv
-cols = ['Date', 'Ticker', 'Country', 'Type', 'Qty', 'Price', 'Currency']
-df_final = df_transformed[cols]
+# Heavily repeated strings as categories
+for col in ('Ticker', 'Type', 'Country', 'Currency'):
+    df_final[col] = df_final[col].astype('category')
 
 # Verify counts
 input_rows = len(df_2024eq)
@@ -27,5 +36,5 @@ print(f"Output rows: {output_rows}")
 
 # Save
 output_filename = 'massaged_tradebook-BU5086-EQ.csv'
-df_final.to_csv(output_filename, index=False)
+df_final.to_csv(output_filename, index=False, lineterminator='\n')
 print(f"Saved {output_rows} rows to {output_filename}")
\ No newline at end of file
@@ -8,28 +8,73 @@ produces `massaged_MF_trades.csv` with columns:
 It attempts to resolve each fund `symbol` (scheme name) to a Yahoo
 Finance symbol by calling Yahoo's search endpoint. If no suitable
 symbol is found, it falls back to using the ISIN as the ticker.
+Resolutions are saved to `mapping_<input>.csv` and reused on later runs
+(pass --no-cache to resolve everything again).
 """
 import csv
-import json
-import time
+import os
+import re
+import threading
 import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from converter_helpers import map_unique
+
+# Use the multi-threaded pyarrow CSV parser when it is installed (also needed for Parquet output)
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
+# Use the C-implemented orjson to parse search responses when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Names that already are Yahoo symbols on an Indian exchange need no search
+YAHOO_SYMBOL_RE = re.compile(r'^[A-Z0-9.]+\.(NS|BO|BSE)$')
+
+YAHOO_MAX_WORKERS = 8  # Concurrent Yahoo search requests in resolve_all
+YAHOO_REQUEST_INTERVAL = 0.35  # Seconds between Yahoo search requests, across all threads
+
+# Shared Yahoo session: keep-alive connections are reused across lookups and threads
+_yahoo_session = requests.Session()
+_yahoo_session.headers.update({"User-Agent": "Mozilla/5.0"})
+_yahoo_session.mount('https://', HTTPAdapter(pool_connections=YAHOO_MAX_WORKERS, pool_maxsize=YAHOO_MAX_WORKERS))
+
+# At most one search request starts within any YAHOO_REQUEST_INTERVAL window,
+# however many threads are resolving names (the same rate as the old sequential loop)
+_yahoo_request_slot = threading.Semaphore(1)
+
+
+def _wait_for_yahoo_request_slot():
+    """Take the request slot; it is released again YAHOO_REQUEST_INTERVAL seconds later"""
+    _yahoo_request_slot.acquire()
+    release_timer = threading.Timer(YAHOO_REQUEST_INTERVAL, _yahoo_request_slot.release)
+    release_timer.daemon = True
+    release_timer.start()
 
 
 def yahoo_search_symbol(query):
     """Search Yahoo Finance and return list of quotes (may be empty).
     Uses the unofficial search endpoint `query2.finance.yahoo.com`.
+    Returns None when the request itself fails (e.g. rate-limited with a 429).
     """
     url = "https://query2.finance.yahoo.com/v1/finance/search?q=" + urllib.parse.quote(query)
-    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.load(resp)
-            return data.get("quotes", [])
-    except Exception:
-        return []
+        _wait_for_yahoo_request_slot()
+        resp = _yahoo_session.get(url, timeout=10)
+        resp.raise_for_status()
+        data = orjson.loads(resp.content) if orjson is not None else resp.json()
+    except (requests.RequestException, ValueError):
+        return None
+    return data.get("quotes", []) if isinstance(data, dict) else []
 
 
 def resolve_ticker(name, isin=None):
@@ -39,9 +84,21 @@ def resolve_ticker(name, isin=None):
       - quote where exchange contains 'BSE'/'NSE' or symbol ends with '.BO'/.NS
       - first quote returned
     If none found, return ISIN (if provided) or original name.
+    Names that already look like a Yahoo symbol (e.g. 'ABC.BO'), or bare numeric
+    codes without an ISIN, are returned as-is without querying Yahoo.
+    Returns None when the search request failed, so the caller can tell a
+    fallback caused by an error from a genuine "no match".
     """
+    # ISINs read from the export are NaN (not None) when the cell is empty, and a
+    # scheme name may arrive as a number
+    isin = _isin_key(isin) or None
+    name = str(name)
+    if YAHOO_SYMBOL_RE.match(name) or (isin is None and name.isdigit()):
+        return name
+
     quotes = yahoo_search_symbol(name)
-    time.sleep(0.35)
+    if quotes is None:
+        return None
     if not quotes:
         return isin or name
 
@@ -62,38 +119,159 @@ def resolve_ticker(name, isin=None):
     return quotes[0].get("symbol") or (isin or name)
 
 
-def convert(input_path: Path, output_path: Path):
-    df = pd.read_csv(input_path)
+def resolve_all(names_with_isins, max_workers=YAHOO_MAX_WORKERS):
+    """Resolve many (name, isin) pairs concurrently.
+    Each lookup is a blocking HTTP call, so a small thread pool overlaps them;
+    the shared request slot keeps the overall request rate to Yahoo unchanged.
+    Returns ({name: ticker} in input order, set of names whose search failed).
+    Failed names map to their ISIN (or name) fallback for this run only.
+    """
+    names_with_isins = list(names_with_isins)
+    total = len(names_with_isins)
+    resolved = {}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(resolve_ticker, name, isin=isin): (name, isin)
+                   for name, isin in names_with_isins}
+        for i, future in enumerate(as_completed(futures), 1):
+            name, isin = futures[future]
+            ticker = future.result()
+            if ticker is None:
+                failed.add(name)
+                ticker = _isin_key(isin) or name
+                print(f"[{i}/{total}] {name} -> {ticker} (search failed, not cached)")
+            else:
+                print(f"[{i}/{total}] {name} -> {ticker}")
+            resolved[name] = ticker
+    return {name: resolved[name] for name, _ in names_with_isins}, failed
+
+
+def isins_by_name(df):
+    """First ISIN seen for each scheme name, as a dict (empty if there is no isin column)"""
+    if 'isin' not in df.columns:
+        return {}
+    return df.drop_duplicates('symbol').set_index('symbol')['isin'].to_dict()
+
+
+def _isin_key(isin):
+    """ISIN as a plain string for cache keys ('' when missing)"""
+    return '' if isin is None or pd.isna(isin) else str(isin)
+
+
+def load_mapping(mapping_path: Path):
+    """Load a previously saved mapping file as {(name, isin): ticker}.
+    Files written before the ISIN column existed load with an empty ISIN,
+    so those names are resolved again once.
+    """
+    if not mapping_path.exists():
+        return {}
+    with open(mapping_path, newline='', encoding='utf-8') as mf:
+        return {(row['SchemeName'], row.get('ISIN') or ''): row['ResolvedTicker']
+                for row in csv.DictReader(mf)}
+
+
+def save_mapping(mapping_path: Path, names_with_isins, mapping):
+    """Write the name -> ticker mapping for manual review (and reuse on the next run)"""
+    tmp_path = mapping_path.with_name(mapping_path.name + '.tmp')
+    pd.DataFrame({
+        'SchemeName': [name for name, _ in names_with_isins],
+        'ISIN': [_isin_key(isin) for _, isin in names_with_isins],
+        'ResolvedTicker': [mapping[name] for name, _ in names_with_isins],
+    }).to_csv(tmp_path, index=False, encoding='utf-8', lineterminator='\n')
+    os.replace(tmp_path, mapping_path)
+
+
+def resolve_with_cache(names_with_isins, mapping_path: Path, use_cache=True):
+    """Resolve (name, isin) pairs, reusing the saved mapping file where the
+    name and ISIN still match; only the rest go to Yahoo. The merged mapping is
+    written back to `mapping_path`. Returns {name: ticker}.
+    """
+    names_with_isins = list(names_with_isins)
+    cache = load_mapping(mapping_path) if use_cache else {}
+    
+    mapping = {}
+    unresolved = []
+    for name, isin in names_with_isins:
+        key = (name, _isin_key(isin))
+        if key in cache:
+            mapping[name] = cache[key]
+        else:
+            unresolved.append((name, isin))
+    
+    if mapping:
+        print(f"Reusing {len(mapping)} cached resolution(s) from {mapping_path}")
+    failed = set()
+    if unresolved:
+        resolved, failed = resolve_all(unresolved)
+        mapping.update(resolved)
+    
+    # Fallbacks from failed searches are left out so they are resolved again next run
+    save_mapping(mapping_path, [(name, isin) for name, isin in names_with_isins if name not in failed], mapping)
+    print(f"Saved mapping to {mapping_path}")
+    return mapping
+
 
+def write_output(out, output_path: Path):
+    """Save converted trades as Parquet if `output_path` ends in .parquet, else as CSV"""
+    # Heavily repeated strings as categories (kept as dictionary columns in Parquet)
+    for col in ('Ticker', 'Type', 'Country', 'Currency'):
+        out[col] = out[col].astype('category')
+    
+    if output_path.suffix == '.parquet':
+        if pyarrow is None:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        out.to_parquet(output_path, index=False, compression='zstd')
+    else:
+        out.to_csv(output_path, index=False, lineterminator='\n')
+
+
+def read_export(input_path):
+    """Read a MF export with trade_date parsed at read time.
+    The header is checked first, so a missing column is reported by name
+    instead of failing inside read_csv. Returns (DataFrame, []) or
+    (None, missing column names).
+    """
     # Expect the export to have at least these columns based on sample:
     # symbol (scheme name), isin, trade_date, trade_type, quantity, price
-    src_cols = df.columns.tolist()
+    src_cols = pd.read_csv(input_path, nrows=0).columns
     required = ["symbol", "isin", "trade_date", "trade_type", "quantity", "price"]
     missing = [c for c in required if c not in src_cols]
+    if missing:
+        return None, missing
+    # Names and ISINs as text (an all-numeric symbol column would otherwise load as int64),
+    # so numeric scheme codes resolve like any name and match the mapping file
+    return pd.read_csv(input_path, engine=CSV_ENGINE, parse_dates=['trade_date'],
+                       dtype={'symbol': str, 'isin': str}), []
+
+
+def convert(input_path: Path, output_path: Path, mapping_path: Path = None, use_cache=True):
+    df, missing = read_export(input_path)
     if missing:
         raise SystemExit(f"Missing expected columns in {input_path}: {missing}")
 
     # Resolve all unique tickers (scheme names)
-    mapping = {}
-    unique_names = df['symbol'].unique()
+    if mapping_path is None:
+        mapping_path = input_path.with_name('mapping_' + input_path.stem + '.csv')
+    unique_names = df['symbol'].dropna().unique()
+    isin_by_name = isins_by_name(df)
     print(f"Resolving {len(unique_names)} unique fund names via Yahoo search...")
-    for i, name in enumerate(unique_names, 1):
-        isin = df.loc[df['symbol'] == name, 'isin'].iloc[0] if 'isin' in df.columns else None
-        ticker = resolve_ticker(name, isin=isin)
-        mapping[name] = ticker
-        print(f"[{i}/{len(unique_names)}] {name} -> {ticker}")
+    mapping = resolve_with_cache(
+        ((name, isin_by_name.get(name)) for name in unique_names),
+        mapping_path,
+        use_cache=use_cache
+    )
 
     # Build final DataFrame with desired columns
     out = pd.DataFrame()
-    out['Date'] = pd.to_datetime(df['trade_date']).dt.date
+    out['Date'] = df['trade_date'].dt.normalize()
     out['Ticker'] = df['symbol'].map(mapping)
     out['Country'] = 'IND'
-    out['Type'] = df['trade_type'].str.upper()
+    out['Type'] = map_unique(df['trade_type'], str.upper)
     out['Qty'] = df['quantity']
     out['Price'] = df['price']
     out['Currency'] = 'INR'
 
-    out.to_csv(output_path, index=False)
+    write_output(out, output_path)
     print(f"Saved {len(out)} rows to {output_path}")
 
 
@@ -102,6 +280,8 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Convert MF tradebook(s) to local format')
     parser.add_argument('inputs', nargs='*', help='Input CSV files to convert. If empty, all files matching "trades*MF*.csv" will be processed')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore saved mapping_*.csv files and resolve every fund name again')
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv', help='Output file format (default: csv)')
     args = parser.parse_args()
 
     files = args.inputs or [str(p) for p in Path('.').glob('trades*MF*.csv')]
@@ -115,46 +295,36 @@ if __name__ == '__main__':
             print(f"Skipping missing file: {in_file}")
             continue
 
-        out_file = in_file.with_name('massaged_' + in_file.name)
+        out_file = in_file.with_name('massaged_' + in_file.stem + '.' + args.format)
         mapping_file = in_file.with_name('mapping_' + in_file.stem + '.csv')
 
         try:
             # Convert and get mapping via resolution step
-            df = pd.read_csv(in_file)
-            required = ["symbol", "isin", "trade_date", "trade_type", "quantity", "price"]
-            missing = [c for c in required if c not in df.columns]
+            df, missing = read_export(in_file)
             if missing:
                 print(f"Skipping {in_file}: missing columns {missing}")
                 continue
 
-            unique_names = df['symbol'].unique()
-            mapping = {}
+            unique_names = df['symbol'].dropna().unique()
+            isin_by_name = isins_by_name(df)
             print(f"Resolving {len(unique_names)} unique fund names in {in_file}...")
-            for i, name in enumerate(unique_names, 1):
-                isin = df.loc[df['symbol'] == name, 'isin'].iloc[0] if 'isin' in df.columns else None
-                ticker = resolve_ticker(name, isin=isin)
-                mapping[name] = ticker
-                print(f"[{i}/{len(unique_names)}] {name} -> {ticker}")
+            mapping = resolve_with_cache(
+                ((name, isin_by_name.get(name)) for name in unique_names),
+                mapping_file,
+                use_cache=not args.no_cache
+            )
 
             out = pd.DataFrame()
-            out['Date'] = pd.to_datetime(df['trade_date']).dt.date
+            out['Date'] = df['trade_date'].dt.normalize()
             out['Ticker'] = df['symbol'].map(mapping)
             out['Country'] = 'IND'
-            out['Type'] = df['trade_type'].str.upper()
+            out['Type'] = map_unique(df['trade_type'], str.upper)
             out['Qty'] = df['quantity']
             out['Price'] = df['price']
             out['Currency'] = 'INR'
 
-            out.to_csv(out_file, index=False)
+            write_output(out, out_file)
             print(f"Saved {len(out)} rows to {out_file}")
 
-            # Save mapping for manual review
-            with open(mapping_file, 'w', newline='', encoding='utf-8') as mf:
-                writer = csv.writer(mf)
-                writer.writerow(['SchemeName', 'ResolvedTicker'])
-                for k, v in mapping.items():
-                    writer.writerow([k, v])
-            print(f"Saved mapping to {mapping_file}")
-
         except Exception as e:
             print(f"Error processing {in_file}: {e}")
@@ -3,47 +3,82 @@
 Display current holdings with FIFO-calculated average buy price and units
 """
 
+from collections import defaultdict
+
+import numpy as np
 import pandas as pd
-from portfolio_calculator import calculate_fifo_avg_price
+from portfolio_calculator import fifo_avg_price_kernel, NUMBA_AVAILABLE
+
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
 
 def show_holdings():
     # Load tradebook
-    df = pd.read_csv('tradebook.csv')
-    df['Date'] = pd.to_datetime(df['Date'])
+    # Repeated strings are loaded as categories (compact, and compared by integer code)
+    df = pd.read_csv('tradebook.csv', engine=CSV_ENGINE, parse_dates=['Date'], date_format='%Y-%m-%d',
+                     dtype={'Ticker': 'category', 'Currency': 'category', 'Type': 'category', 'Source_File': 'category'})
+    
+    # Net quantity per ticker in a single pass (total BUY minus total SELL). Each group is
+    # summed with Series.sum, like the per-ticker filters this replaced, so the float
+    # residue of fully sold tickers (and which of them show up below) doesn't change
+    totals = df.pivot_table(index='Ticker', columns='Type', values='Qty',
+                            aggfunc=lambda qty: qty.sum(), fill_value=0, observed=True)
+    totals = totals.reindex(columns=['BUY', 'SELL'], fill_value=0)
+    net_qty_by_ticker = totals['BUY'] - totals['SELL']
     
-    # Get unique tickers
-    tickers = df['Ticker'].unique()
+    # Only show if there are holdings
+    held_qty = net_qty_by_ticker[net_qty_by_ticker > 0]
+    currency_by_ticker = df.drop_duplicates('Ticker').set_index('Ticker')['Currency']
     
     holdings = []
+    currency_totals = defaultdict(float)
     
-    for ticker in tickers:
-        ticker_trades = df[df['Ticker'] == ticker].copy()
+    # Sort once by date (BUY before SELL on the same date); groupby keeps this order per ticker
+    held_trades = df[df['Ticker'].isin(held_qty.index)].copy()
+    held_trades['Is_Buy'] = held_trades['Type'] == 'BUY'
+    held_trades['Is_Sell'] = held_trades['Type'] == 'SELL'
+    held_trades['Type_Sort'] = held_trades['Type'].map({'BUY': 0, 'SELL': 1}).astype(float)
+    held_trades = held_trades.sort_values(['Date', 'Type_Sort'], kind='mergesort')
+    
+    if NUMBA_AVAILABLE:
+        # Compile the kernel up front so the first ticker doesn't pay for it
+        fifo_avg_price_kernel(np.ones(1), np.ones(1), np.ones(1, dtype=bool), np.zeros(1, dtype=bool))
+    
+    for ticker, ticker_trades in held_trades.groupby('Ticker', sort=False, observed=True):
+        net_qty = held_qty[ticker]
+        
+        # Calculate FIFO average price
+        avg_price = fifo_avg_price_kernel(
+            ticker_trades['Qty'].to_numpy(dtype=float),
+            ticker_trades['Price'].to_numpy(dtype=float),
+            ticker_trades['Is_Buy'].to_numpy(),
+            ticker_trades['Is_Sell'].to_numpy()
+        )
         
-        # Calculate totals
-        total_buy = ticker_trades[ticker_trades['Type'] == 'BUY']['Qty'].sum()
-        total_sell = ticker_trades[ticker_trades['Type'] == 'SELL']['Qty'].sum()
-        net_qty = total_buy - total_sell
+        currency = currency_by_ticker[ticker]
+        total_value = net_qty * avg_price
+        currency_totals[currency] += total_value
         
-        # Only show if there are holdings
-        if net_qty > 0:
-            # Calculate FIFO average price
-            avg_price = calculate_fifo_avg_price(ticker_trades)
-            
-            # Get currency
-            currency = ticker_trades.iloc[0]['Currency']
-            
-            holdings.append({
-                'Ticker': ticker,
-                'Units': net_qty,
-                'Avg Buy Price': avg_price,
-                'Currency': currency,
-                'Total Value': net_qty * avg_price
-            })
+        holdings.append({
+            'Ticker': ticker,
+            'Units': net_qty,
+            'Avg Buy Price': avg_price,
+            'Currency': currency,
+            'Total Value': total_value
+        })
     
     # Create DataFrame and sort by ticker
     holdings_df = pd.DataFrame(holdings)
     holdings_df = holdings_df.sort_values('Ticker')
     
+    # Export to CSV for easy comparison (pandas' writer keeps the usual unquoted format)
+    holdings_df.to_csv('current_holdings_fifo.csv', index=False)
+    
     # Display
     print("\n" + "="*100)
     print("CURRENT HOLDINGS - FIFO METHOD")
@@ -54,27 +89,27 @@ def show_holdings():
     print(f"{'Ticker':<15} {'Units':>10} {'Avg Buy Price':>15} {'Currency':>10} {'Total Value':>18}")
     print("-"*100)
     
-    for _, row in holdings_df.iterrows():
-        ticker = row['Ticker']
-        units = f"{row['Units']:,.0f}"
-        avg_price = f"{row['Avg Buy Price']:,.2f}"
-        currency = row['Currency']
-        total_value = f"{row['Total Value']:,.2f}"
-        
-        print(f"{ticker:<15} {units:>10} {avg_price:>15} {currency:>10} {total_value:>18}")
+    units_str = holdings_df['Units'].map('{:,.0f}'.format)
+    avg_price_str = holdings_df['Avg Buy Price'].map('{:,.2f}'.format)
+    total_value_str = holdings_df['Total Value'].map('{:,.2f}'.format)
+    
+    lines = [
+        f"{ticker:<15} {units:>10} {avg_price:>15} {currency:>10} {total_value:>18}"
+        for ticker, units, avg_price, currency, total_value in zip(
+            holdings_df['Ticker'], units_str, avg_price_str, holdings_df['Currency'], total_value_str
+        )
+    ]
+    print("\n".join(lines))
     
     print("-"*100)
     
-    # Calculate totals by currency
+    # Totals by currency (accumulated while building the holdings)
     print("\nTOTAL VALUE BY CURRENCY:")
-    currency_totals = holdings_df.groupby('Currency')['Total Value'].sum()
-    for currency, total in currency_totals.items():
+    for currency, total in sorted(currency_totals.items()):
         print(f"  {currency}: {total:,.2f}")
     
     print("\n" + "="*100)
     
-    # Export to CSV for easy comparison
-    holdings_df.to_csv('current_holdings_fifo.csv', index=False)
     print("\n✓ Holdings exported to: current_holdings_fifo.csv")
     print("\n")
 
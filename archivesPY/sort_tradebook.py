@@ -7,6 +7,14 @@ import pandas as pd
 import shutil
 from datetime import datetime
 
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
 def sort_tradebook():
     """Sort tradebook.csv by Date (newest first), with SELLs before BUYs on same date"""
     tradebook_file = 'tradebook.csv'
@@ -23,29 +31,25 @@ def sort_tradebook():
     
     # Load tradebook
     print(f"\n📂 Loading {tradebook_file}...")
-    df = pd.read_csv(tradebook_file)
+    df = pd.read_csv(tradebook_file, engine=CSV_ENGINE)
     print(f"   Loaded {len(df)} trades")
     
-    # Convert Date to datetime for sorting
-    df['Date'] = pd.to_datetime(df['Date'])
+    # Dates are stored as ISO-8601 strings (YYYY-MM-DD), which sort correctly as-is
     
-    # Create a sort key: SELL=0, BUY=1 (so SELLs come before BUYs on same date when descending)
+    # Order Type as a categorical: SELL < BUY (so SELLs come before BUYs on same date when descending)
     # This ensures that when we reverse for FIFO calculation, BUYs will be before SELLs
-    df['Type_Sort'] = df['Type'].map({'SELL': 0, 'BUY': 1})
+    # Any unexpected Type values are kept and sort after BUY
+    extra_types = sorted(set(df['Type'].dropna()) - {'SELL', 'BUY'})
+    df['Type'] = pd.Categorical(df['Type'], categories=['SELL', 'BUY'] + extra_types, ordered=True)
     
     # Sort by Date (descending - newest first), then by Type
     print(f"\n🔄 Sorting trades by date (newest first, SELLs before BUYs on same date)...")
-    df_sorted = df.sort_values(['Date', 'Type_Sort'], ascending=[False, True]).reset_index(drop=True)
-    
-    # Remove the temporary sort column
-    df_sorted = df_sorted.drop('Type_Sort', axis=1)
-    
-    # Format date back to string for CSV
-    df_sorted['Date'] = df_sorted['Date'].dt.strftime('%Y-%m-%d')
+    df_sorted = df.sort_values(['Date', 'Type'], ascending=[False, True], kind='mergesort', ignore_index=True)
     
-    # Save sorted tradebook
+    # Save sorted tradebook. pandas' writer, not pyarrow's: it keeps the file's format
+    # (unquoted strings, True/False, 1.0), so sorting doesn't rewrite every line
     print(f"\n💾 Saving sorted tradebook...")
-    df_sorted.to_csv(tradebook_file, index=False)
+    df_sorted.to_csv(tradebook_file, index=False, lineterminator='\n')
     
     print(f"\n✅ Tradebook sorted successfully!")
     print(f"\n📊 Summary:")
@@ -5,6 +5,13 @@ Test script to verify Year_End_Price functionality in snapshots
 
 import pandas as pd
 
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
 def test_snapshot_prices():
     """Check which snapshots have Year_End_Price data"""
     print("=" * 70)
@@ -15,7 +22,7 @@ def test_snapshot_prices():
     for year in [2022, 2023, 2024, 2025]:
         snapshot_file = f'archivesCSV/holdings_snapshot_{year}.csv'
         try:
-            df = pd.read_csv(snapshot_file)
+            df = pd.read_csv(snapshot_file, engine=CSV_ENGINE)
             
             # Check if Year_End_Price column exists
             if 'Year_End_Price' in df.columns:
@@ -4,7 +4,7 @@ Tradebook Builder - Consolidated Trade Management System
 
 This module consolidates all tradebook management functionality including:
 - Trade file parsing and consolidation
-- Exchange rate caching
+- Exchange rate caching (persisted across runs)
 - SGB price caching
 - CLI management commands
 
@@ -25,18 +25,50 @@ As a module:
 """
 
 import pandas as pd
+import numpy as np
 import json
 import os
-import glob
+import atexit
+import fnmatch
+import logging
+import mmap
 import yfinance as yf
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
 
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pa = None
+    CSV_ENGINE = 'c'
+
+# Use the C-implemented orjson for cache/metadata files when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Store the SGB price cache as msgpack when it is installed (smaller and faster than JSON)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Suppress yfinance logger messages
+logging.getLogger('yfinance').setLevel(logging.CRITICAL)
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -51,49 +83,211 @@ if not os.path.exists(WORKING_DIR):
     exit(1)
 
 TRADEBOOK_FILE = os.path.join(WORKING_DIR, 'tradebook.csv')
+TRADEBOOK_PARQUET_FILE = os.path.join(WORKING_DIR, 'tradebook.parquet')  # Typed copy for fast loading
 PROCESSED_FILES_METADATA = os.path.join(WORKING_DIR, 'tradebook_processed_files.json')
-SGB_PRICE_CACHE_FILE = os.path.join(WORKING_DIR, 'sgb_price_cache.json')
+SGB_PRICE_CACHE_JSON_FILE = os.path.join(WORKING_DIR, 'sgb_price_cache.json')
+SGB_PRICE_CACHE_FILE = (os.path.join(WORKING_DIR, 'sgb_price_cache.msgpack') if msgpack is not None
+                        else SGB_PRICE_CACHE_JSON_FILE)
+EXCHANGE_RATE_CACHE_FILE = os.path.join(WORKING_DIR, 'exchange_rate_cache.json')
 CACHE_VALIDITY_HOURS = 6
+JSON_MMAP_THRESHOLD_BYTES = 64 * 1024  # Memory-map JSON files at least this large
+SGB_DETECTION_ROWS = 10  # Leading rows checked for SGB tickers in files not named *SGB*
+NSE_MAX_WORKERS = 8  # Concurrent NSE quote requests in fetch_sgb_prices_bulk
+NSE_REQUEST_INTERVAL = 0.5  # Seconds each request slot stays taken (rate limit for NSE)
 FALLBACK_USD_INR_RATE = float(os.getenv('FALLBACK_USD_INR_RATE', '90.0'))
 
 # Global cache for exchange rates during current session
 _exchange_rate_session_cache = {}
 
+# Keys in the session cache that hold real historical market rates.
+# Only these are persisted - fallback rates are time-varying and stay in memory.
+_historical_rate_keys = set()
+
+# Rates as last read from / written to EXCHANGE_RATE_CACHE_FILE
+_persisted_exchange_rates = {}
+
+# SGB prices fetched with flush=False, written to SGB_PRICE_CACHE_FILE by flush_sgb_cache()
+_pending_sgb_prices = {}
+
+# Parsed SGB cache and the (path, mtime ns) of the file it was read from / written to
+_sgb_cache_obj = None
+_sgb_cache_mtime = None
+
+# Guards the SGB cache dicts while fetch_sgb_prices_bulk runs lookups on several threads
+_sgb_cache_lock = threading.RLock()
+
+
+# ============================================================================
+# JSON FILE HELPERS
+# ============================================================================
+
+def read_json_file(filepath):
+    """
+    Read a JSON file, using orjson when available.
+    Large files are memory-mapped and parsed in place instead of being copied into a buffer.
+    Raises json.JSONDecodeError on invalid content (orjson's error subclasses it).
+    """
+    if orjson is not None:
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < JSON_MMAP_THRESHOLD_BYTES:
+                return orjson.loads(f.read())
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+    
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def write_json_file(filepath, data, sort_keys=False, compact=False):
+    """
+    Write data as human-readable (2-space indented) JSON, using orjson when available.
+    compact=True skips the indentation for machine-only files.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if not compact:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(data, option=option))
+        return
+    
+    with open(filepath, 'w') as f:
+        if compact:
+            json.dump(data, f, separators=(',', ':'), sort_keys=sort_keys)
+        else:
+            json.dump(data, f, indent=2, sort_keys=sort_keys)
+
+
+# ============================================================================
+# EXCHANGE RATE CACHING
+# ============================================================================
+
+def load_exchange_rate_cache():
+    """Load persisted historical exchange rates into the session cache"""
+    if os.path.exists(EXCHANGE_RATE_CACHE_FILE):
+        try:
+            cache = read_json_file(EXCHANGE_RATE_CACHE_FILE)
+        except json.JSONDecodeError:
+            print(f"⚠️ Warning: Could not read {EXCHANGE_RATE_CACHE_FILE}, starting fresh")
+            return
+        
+        for cache_key, rate in cache.items():
+            _exchange_rate_session_cache[cache_key] = float(rate)
+            _historical_rate_keys.add(cache_key)
+            _persisted_exchange_rates[cache_key] = float(rate)
+
+
+def save_exchange_rate_cache():
+    """Persist historical exchange rates from the session cache (fallback rates are skipped)"""
+    cache = {
+        key: _exchange_rate_session_cache[key]
+        for key in _historical_rate_keys
+        if key in _exchange_rate_session_cache
+    }
+    
+    # Nothing new since the cache was loaded
+    if not cache or cache == _persisted_exchange_rates:
+        return
+    
+    try:
+        write_json_file(EXCHANGE_RATE_CACHE_FILE, cache, sort_keys=True)
+        _persisted_exchange_rates.clear()
+        _persisted_exchange_rates.update(cache)
+    except OSError as e:
+        print(f"⚠️ Warning: Could not save {EXCHANGE_RATE_CACHE_FILE}: {e}")
+
+
+load_exchange_rate_cache()
+atexit.register(save_exchange_rate_cache)
+
 
 # ============================================================================
 # TRADEBOOK MANAGEMENT
 # ============================================================================
 
+def scan_trade_files():
+    """
+    List the trade CSV files in the archivesCSV directory in a single directory scan.
+    
+    Returns:
+        Dictionary of {filepath: mtime} (trades*.csv files first, then SGBs.csv)
+    """
+    trade_files = {}
+    sgb_files = {}
+    with os.scandir(WORKING_DIR) as entries:
+        for entry in entries:
+            if fnmatch.fnmatchcase(entry.name, 'trades*.csv'):
+                target = trade_files
+            elif entry.name == 'SGBs.csv':
+                target = sgb_files
+            else:
+                continue
+            if entry.is_file():
+                target[entry.path] = entry.stat().st_mtime
+    trade_files.update(sgb_files)
+    return trade_files
+
+
 def get_trade_files():
     """Get all trade CSV files in the archivesCSV directory"""
-    trade_files = glob.glob(os.path.join(WORKING_DIR, 'trades*.csv')) + glob.glob(os.path.join(WORKING_DIR, 'SGBs.csv'))
-    return [f for f in trade_files if os.path.isfile(f)]
+    return list(scan_trade_files())
+
+
+def make_metadata_entry(mtime):
+    """
+    Build a processed-file metadata entry.
+    'mtime' is the raw Unix modification time used for comparisons,
+    'iso' is the same time in human-readable form.
+    """
+    return {'mtime': mtime, 'iso': format_mtime(mtime)}
+
+
+def parse_mtime_string(time_str):
+    """Convert a 'YYYY-MM-DD HH:MM:SS' string to a Unix timestamp (0 if unparseable)"""
+    try:
+        return datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S').timestamp()
+    except (ValueError, TypeError):
+        return 0
 
 
 def load_processed_files_metadata():
-    """Load metadata about which files have been processed"""
+    """
+    Load metadata about which files have been processed
+    
+    Returns:
+        Dictionary of {filename: {'mtime': float, 'iso': str}}
+    """
     if os.path.exists(PROCESSED_FILES_METADATA):
         try:
-            with open(PROCESSED_FILES_METADATA, 'r') as f:
-                metadata = json.load(f)
-                
-                # Convert old formats to new simplified format if needed
-                converted = {}
-                for filename, value in metadata.items():
-                    if isinstance(value, (int, float)):
-                        # Old format: Unix timestamp - convert to ISO string
-                        converted[filename] = datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
-                    elif isinstance(value, dict):
-                        # Dict format with both timestamp and modified_time - extract modified_time
-                        converted[filename] = value.get('modified_time', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                    elif isinstance(value, str):
-                        # New format: already a string
-                        converted[filename] = value
+            metadata = read_json_file(PROCESSED_FILES_METADATA)
+            
+            # Convert old formats to the current {'mtime', 'iso'} format if needed
+            converted = {}
+            for filename, value in metadata.items():
+                if isinstance(value, dict) and 'mtime' in value:
+                    # Current format
+                    converted[filename] = make_metadata_entry(float(value['mtime']))
+                elif isinstance(value, (int, float)):
+                    # Old format: Unix timestamp
+                    converted[filename] = make_metadata_entry(float(value))
+                elif isinstance(value, dict):
+                    # Old dict format with timestamp and/or modified_time
+                    if isinstance(value.get('timestamp'), (int, float)):
+                        converted[filename] = make_metadata_entry(float(value['timestamp']))
                     else:
-                        # Unexpected format - skip
-                        continue
-                
-                return converted
+                        converted[filename] = make_metadata_entry(parse_mtime_string(value.get('modified_time')))
+                elif isinstance(value, str):
+                    # Old format: 'YYYY-MM-DD HH:MM:SS' string (parsed once here)
+                    converted[filename] = make_metadata_entry(parse_mtime_string(value))
+                else:
+                    # Unexpected format - skip
+                    continue
+            
+            return converted
         except json.JSONDecodeError:
             print(f"⚠️ Warning: Could not read {PROCESSED_FILES_METADATA}, starting fresh")
             return {}
@@ -102,8 +296,7 @@ def load_processed_files_metadata():
 
 def save_processed_files_metadata(metadata):
     """Save metadata about processed files in human-readable format"""
-    with open(PROCESSED_FILES_METADATA, 'w') as f:
-        json.dump(metadata, f, indent=2, sort_keys=True)
+    write_json_file(PROCESSED_FILES_METADATA, metadata, sort_keys=True)
 
 
 def get_file_modification_time(filepath):
@@ -111,33 +304,42 @@ def get_file_modification_time(filepath):
     return os.path.getmtime(filepath)
 
 
+def format_mtime(mtime):
+    """Format a Unix modification time as a human-readable string"""
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+
 def get_file_modification_time_string(filepath):
     """Get file modification time as a human-readable string"""
-    mtime = os.path.getmtime(filepath)
-    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    return format_mtime(os.path.getmtime(filepath))
+
+
+def get_file_mtimes(filepaths):
+    """Stat each file once and return a {filepath: mtime} dictionary"""
+    return {filepath: os.stat(filepath).st_mtime for filepath in filepaths}
 
 
-def identify_new_or_modified_files(trade_files, metadata):
-    """Identify which files are new or have been modified since last processing"""
+def identify_new_or_modified_files(trade_files, metadata, mtimes=None):
+    """
+    Identify which files are new or have been modified since last processing
+    
+    Args:
+        trade_files: List of trade file paths
+        metadata: Processed files metadata
+        mtimes: Optional {filepath: mtime} from get_file_mtimes() to avoid re-stat'ing
+    """
+    if mtimes is None:
+        mtimes = get_file_mtimes(trade_files)
+    
     new_or_modified = []
     
     for filepath in trade_files:
         # Use basename for metadata key to ensure consistency
         file_key = os.path.basename(filepath)
-        current_mtime = get_file_modification_time(filepath)
+        current_mtime = mtimes[filepath]
         
-        # Get stored timestamp string and convert to Unix timestamp for comparison
-        if file_key in metadata:
-            stored_time_str = metadata[file_key]
-            try:
-                # Parse the stored time string to Unix timestamp
-                stored_dt = datetime.strptime(stored_time_str, '%Y-%m-%d %H:%M:%S')
-                processed_mtime = stored_dt.timestamp()
-            except (ValueError, AttributeError):
-                # If parsing fails, treat as not processed
-                processed_mtime = 0
-        else:
-            processed_mtime = 0
+        # Compare against the stored Unix mtime (0 if never processed)
+        processed_mtime = metadata[file_key]['mtime'] if file_key in metadata else 0
         
         if current_mtime > processed_mtime:
             new_or_modified.append(filepath)
@@ -145,27 +347,164 @@ def identify_new_or_modified_files(trade_files, metadata):
     return new_or_modified
 
 
+def downcast_float_lossless(series):
+    """
+    Store a numeric column as float32 only when every value survives the round-trip exactly.
+    Prices like 1344.400024 would otherwise be silently rounded in the tradebook.
+    """
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series
+    
+    values = series.to_numpy(dtype=np.float64)
+    downcast = values.astype(np.float32)
+    if np.array_equal(downcast.astype(np.float64), values, equal_nan=True):
+        return pd.Series(downcast, index=series.index, name=series.name)
+    return series
+
+
 def parse_trade_file(filepath):
     """Parse a single trade file and return a DataFrame"""
     try:
-        df = pd.read_csv(filepath)
+        df = pd.read_csv(filepath, engine=CSV_ENGINE, parse_dates=['Date'], date_format='%Y-%m-%d')
         
         # Add source file column using basename only
         df['Source_File'] = os.path.basename(filepath)
         
         # Detect if it's an SGB file
+        # SGB-ness is a file-level property, so the first few tickers are enough to decide
         is_sgb = 'SGB' in filepath or (
             'Ticker' in df.columns and 
-            df['Ticker'].astype(str).str.contains('SGB', na=False).any()
+            df['Ticker'].head(SGB_DETECTION_ROWS).astype(str).str.contains('SGB', regex=False, na=False).any()
         )
         df['Is_SGB'] = is_sgb
         
+        # Compact dtypes: repeated strings as categories, numbers as float32 where lossless
+        for col in ('Ticker', 'Currency', 'Type', 'Source_File'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        for col in ('Qty', 'Price', 'Exchange_Rate'):
+            if col in df.columns:
+                df[col] = downcast_float_lossless(df[col])
+        
         return df
     except Exception as e:
         print(f"⚠️ Error parsing {filepath}: {e}")
         return None
 
 
+def parse_trade_files(filepaths):
+    """
+    Parse several trade files concurrently.
+    pd.read_csv releases the GIL while parsing, so a thread pool overlaps the reads.
+    Returns a list of DataFrames (or None for failures) in the same order as filepaths.
+    """
+    for filepath in filepaths:
+        print(f"   Parsing {os.path.basename(filepath)}...")
+    
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(parse_trade_file, filepaths))
+
+
+def trades_match_existing(file_df, existing_df):
+    """
+    Check whether a re-parsed trade file holds exactly the trades already in the tradebook.
+    Row order is ignored because the tradebook is re-sorted by date after every update.
+    """
+    if len(file_df) != len(existing_df):
+        return False
+    
+    columns = list(file_df.columns)
+    if any(col not in existing_df.columns for col in columns):
+        return False
+    
+    try:
+        # Align dtypes with the tradebook (e.g. integer Qty read back as float)
+        parsed = file_df[columns].astype(existing_df[columns].dtypes.to_dict())
+        parsed = parsed.sort_values(columns, ignore_index=True)
+        existing = existing_df[columns].sort_values(columns, ignore_index=True)
+    except (ValueError, TypeError):
+        return False
+    
+    return parsed.equals(existing)
+
+
+def ascending_date_order(dates):
+    """
+    Row positions that put `dates` in stable ascending order, in linear time when the
+    dates are already one sorted run (oldest-first from this builder, or newest-first
+    after sort_tradebook). Returns None when they are not sorted either way.
+    """
+    if dates.is_monotonic_increasing:
+        return np.arange(len(dates))
+    if not dates.is_monotonic_decreasing:
+        return None
+    
+    # Newest-first: walk the equal-date blocks from the back, keeping each block's
+    # rows in file order (what a stable sort would do)
+    values = dates.to_numpy()[::-1]
+    block_starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    block_ends = np.r_[block_starts[1:], len(values)]
+    lengths = block_ends - block_starts
+    positions = np.arange(len(values))
+    return len(values) - np.repeat(block_starts + block_ends, lengths) + positions
+
+
+def merge_trades_by_date(df, new_df):
+    """
+    Combine the tradebook with new trades in chronological order.
+    When the tradebook is one sorted run, only the new trades are sorted and they are
+    spliced in with searchsorted (after existing trades on the same date), so the big
+    frame is never re-sorted. The result matches a stable sort of the concatenation;
+    an unsorted tradebook falls back to exactly that.
+    """
+    combined = pd.concat([df, new_df], ignore_index=True)
+    existing_order = ascending_date_order(df['Date'])
+    if existing_order is None or combined['Date'].dtype.kind != 'M':
+        return combined.sort_values('Date', kind='mergesort', ignore_index=True)
+    
+    existing_dates = df['Date'].to_numpy()[existing_order]
+    new_order = np.argsort(new_df['Date'].to_numpy(), kind='stable')
+    new_dates = new_df['Date'].to_numpy()[new_order]
+    
+    # Output slot of each new trade: existing rows at or before its date, plus the new ones before it
+    new_slots = np.searchsorted(existing_dates, new_dates, side='right') + np.arange(len(new_dates))
+    merged_order = np.empty(len(combined), dtype=np.intp)
+    is_new_slot = np.zeros(len(combined), dtype=bool)
+    is_new_slot[new_slots] = True
+    merged_order[new_slots] = len(df) + new_order
+    merged_order[~is_new_slot] = existing_order
+    return combined.take(merged_order).reset_index(drop=True)
+
+
+def write_tradebook(df):
+    """
+    Write the tradebook to a temporary file and atomically move it into place,
+    so an interrupted run never leaves a truncated tradebook.csv behind.
+    With pyarrow installed, a typed Parquet copy (tradebook.parquet) is written next to it.
+    """
+    table = None
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type object columns can't be converted; skip the Parquet copy
+            table = None
+    
+    temp_file = TRADEBOOK_FILE + '.tmp'
+    # pandas' writer keeps the hand-edited CSV format as it is (unquoted strings,
+    # True/False, 1.0); pyarrow's writer would rewrite every line
+    df.to_csv(temp_file, index=False, lineterminator='\n')
+    os.replace(temp_file, TRADEBOOK_FILE)
+    
+    # Readers only use the Parquet copy while it is at least as new as the CSV
+    if table is not None:
+        temp_parquet = TRADEBOOK_PARQUET_FILE + '.tmp'
+        pq.write_table(table, temp_parquet)
+        os.replace(temp_parquet, TRADEBOOK_PARQUET_FILE)
+    elif os.path.exists(TRADEBOOK_PARQUET_FILE):
+        os.remove(TRADEBOOK_PARQUET_FILE)
+
+
 def get_exchange_rate(currency, trade_date):
     """
     Get exchange rate for a given currency and date.
@@ -180,11 +519,16 @@ def get_exchange_rate(currency, trade_date):
         return 1.0
     
     if currency == 'USD':
-        import sys
-        from io import StringIO
+        # Convert trade_date to datetime if it's a string
+        if isinstance(trade_date, str):
+            date_obj = pd.to_datetime(trade_date)
+        else:
+            date_obj = trade_date
+        
+        date_str = date_obj.strftime('%Y-%m-%d')
         
         # Check session cache first
-        cache_key = f"{currency}_{trade_date}"
+        cache_key = f"{currency}_{date_str}"
         if cache_key in _exchange_rate_session_cache:
             return _exchange_rate_session_cache[cache_key]
         
@@ -195,52 +539,14 @@ def get_exchange_rate(currency, trade_date):
             _exchange_rate_session_cache[cache_key] = rate
             return rate
         
-        # Try Yahoo Finance first with multiple ticker formats (suppress output)
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        sys.stdout = StringIO()
-        sys.stderr = StringIO()
-        
-        try:
-            # Convert trade_date to datetime if it's a string
-            if isinstance(trade_date, str):
-                date_obj = pd.to_datetime(trade_date)
-            else:
-                date_obj = trade_date
-            
-            date_str = date_obj.strftime('%Y-%m-%d')
-            
-            for ticker in ['INR=X', 'USDINR=X']:
-                try:
-                    data = yf.download(ticker, start=date_str, end=date_str, progress=False)
-                    
-                    if not data.empty and 'Close' in data.columns:
-                        rate = float(data['Close'].iloc[0])
-                        sys.stdout = old_stdout
-                        sys.stderr = old_stderr
-                        _exchange_rate_session_cache[cache_key] = rate
-                        return rate
-                except Exception:
-                    continue
-            
-            # If exact date fails, try a few days before
-            for ticker in ['INR=X', 'USDINR=X']:
-                for days_back in [1, 2, 3, 7]:
-                    try:
-                        past_date = (date_obj - pd.Timedelta(days=days_back)).strftime('%Y-%m-%d')
-                        data = yf.download(ticker, start=past_date, end=past_date, progress=False)
-                        if not data.empty and 'Close' in data.columns:
-                            rate = float(data['Close'].iloc[0])
-                            sys.stdout = old_stdout
-                            sys.stderr = old_stderr
-                            _exchange_rate_session_cache[cache_key] = rate
-                            return rate
-                    except Exception:
-                        continue
-        finally:
-            # Always restore stdout/stderr
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+        # Try Yahoo Finance first: one download per ticker format covering the week up to
+        # the trade date, using the close on that date or the most recent one before it
+        rate = fetch_exchange_rate_series(currency, [date_obj]).iloc[0]
+        if pd.notna(rate):
+            rate = float(rate)
+            _exchange_rate_session_cache[cache_key] = rate
+            _historical_rate_keys.add(cache_key)
+            return rate
         
         # Try exchangerate-api.com (current rate - free API)
         try:
@@ -255,7 +561,7 @@ def get_exchange_rate(currency, trade_date):
                     _exchange_rate_session_cache[fallback_key] = rate
                     _exchange_rate_session_cache[cache_key] = rate
                     return rate
-        except Exception:
+        except (requests.RequestException, ValueError, TypeError):
             pass  # Continue to last resort
         
         # Last resort: use fallback rate from environment
@@ -268,6 +574,56 @@ def get_exchange_rate(currency, trade_date):
     return 1.0
 
 
+def fetch_exchange_rate_series(currency, trade_dates):
+    """
+    Fetch exchange rates for many dates of one currency with a single download.
+    Downloads the whole date range once and forward-fills weekends/holidays.
+    
+    Returns a Series of rates indexed by the (unique) requested dates.
+    Dates that could not be resolved are NaN so callers can fall back
+    to get_exchange_rate() for them.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(trade_dates)).unique())
+    
+    if currency == 'INR':
+        return pd.Series(1.0, index=dates)
+    
+    if currency != 'USD':
+        # Same as get_exchange_rate: other currencies are not converted
+        return pd.Series(1.0, index=dates)
+    
+    # Start a week early so the first dates can forward-fill from the previous trading day
+    start_str = (dates.min() - pd.Timedelta(days=7)).strftime('%Y-%m-%d')
+    end_str = (dates.max() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    for ticker in ['INR=X', 'USDINR=X']:
+        try:
+            data = yf.download(ticker, start=start_str, end=end_str, progress=False)
+        except Exception:
+            continue
+        
+        if data.empty or 'Close' not in data.columns:
+            continue
+        
+        close = data['Close']
+        if isinstance(close, pd.DataFrame):
+            # Newer yfinance versions return one column per ticker
+            close = close.iloc[:, 0]
+        close = close.dropna()
+        if close.empty:
+            continue
+        
+        if close.index.tz is not None:
+            close.index = close.index.tz_localize(None)
+        close.index = close.index.normalize()
+        close = close[~close.index.duplicated(keep='last')]
+        
+        # Use the most recent close within a week, like the per-date days-back search
+        return close.reindex(dates, method='ffill', tolerance=pd.Timedelta(days=7)).astype(float)
+    
+    return pd.Series(float('nan'), index=dates)
+
+
 def add_exchange_rates_to_trades(df):
     """
     Add Exchange_Rate column to trades DataFrame.
@@ -287,30 +643,33 @@ def add_exchange_rates_to_trades(df):
     # Get unique currency-date combinations that need rates
     needs_rate = df[missing_rate_mask][['Currency', 'Date']].drop_duplicates()
     
-    # Build a cache of rates
+    # Build a cache of rates keyed by (currency, date)
     rate_cache = {}
-    # Also cache API fallback rates per currency to avoid repeated API calls
-    currency_fallback_cache = {}
     
-    for _, row in needs_rate.iterrows():
-        currency = row['Currency']
-        trade_date = row['Date']
+    # Fetch each currency's whole date range in one request instead of one per date
+    for currency, trade_dates in needs_rate.groupby('Currency', observed=True)['Date']:
+        rates = fetch_exchange_rate_series(currency, trade_dates)
+        resolved = rates.reindex(pd.DatetimeIndex(trade_dates))
         
-        cache_key = f"{currency}_{trade_date}"
-        if cache_key not in rate_cache:
-            rate = get_exchange_rate(currency, trade_date)
-            rate_cache[cache_key] = rate
+        if currency != 'INR':
+            # Remember every rate the batch download resolved in one update
+            found = resolved.dropna()
+            session_keys = [f"{currency}_{day}" for day in found.index.strftime('%Y-%m-%d')]
+            _exchange_rate_session_cache.update(zip(session_keys, found.tolist()))
+            _historical_rate_keys.update(session_keys)
+        
+        for trade_date, rate in zip(trade_dates, resolved.tolist()):
+            if pd.isna(rate):
+                # Batch download didn't cover this date - use the per-date fallback chain
+                rate = get_exchange_rate(currency, trade_date)
             
-            # If we got a fallback rate, cache it for this currency
-            if currency not in currency_fallback_cache:
-                currency_fallback_cache[currency] = rate
+            rate_cache[(currency, trade_date)] = rate
     
-    # Apply rates to all trades
-    for idx in df[missing_rate_mask].index:
-        currency = df.at[idx, 'Currency']
-        trade_date = df.at[idx, 'Date']
-        cache_key = f"{currency}_{trade_date}"
-        df.at[idx, 'Exchange_Rate'] = rate_cache.get(cache_key, 1.0)
+    # Apply rates to all trades with a single lookup on (Currency, Date)
+    rate_series = pd.Series(rate_cache, dtype=float)
+    missing_trades = df.loc[missing_rate_mask]
+    keys = pd.MultiIndex.from_arrays([missing_trades['Currency'], missing_trades['Date']])
+    df.loc[missing_rate_mask, 'Exchange_Rate'] = rate_series.reindex(keys).fillna(1.0).values
     
     print(f"✅ Exchange rates calculated for {missing_rate_mask.sum()} trades")
     
@@ -322,45 +681,59 @@ def load_or_create_tradebook():
     Load existing tradebook or create new one from source files.
     Only processes new or modified files incrementally.
     """
-    trade_files = get_trade_files()
+    # Stat every source file once; reused for change detection and metadata
+    file_mtimes = scan_trade_files()
+    trade_files = list(file_mtimes)
     metadata = load_processed_files_metadata()
     
     # Check if tradebook exists
     if os.path.exists(TRADEBOOK_FILE):
         # Load existing tradebook
-        df = pd.read_csv(TRADEBOOK_FILE)
+        df = pd.read_csv(TRADEBOOK_FILE, engine=CSV_ENGINE, parse_dates=['Date'], date_format='%Y-%m-%d')
         print(f"📂 Loaded existing tradebook: {len(df)} trades")
         
         # Check for new or modified files
-        new_files = identify_new_or_modified_files(trade_files, metadata)
+        new_files = identify_new_or_modified_files(trade_files, metadata, file_mtimes)
         
         if new_files:
+            new_file_basenames = [os.path.basename(filepath) for filepath in new_files]
             print(f"🔄 Found {len(new_files)} new or modified file(s) to process:")
-            for filepath in new_files:
-                print(f"   - {os.path.basename(filepath)}")
+            for file_basename in new_file_basenames:
+                print(f"   - {file_basename}")
+            
+            # Row positions of existing trades per source file, computed in one pass
+            rows_by_file = df.groupby('Source_File', sort=False, observed=True).indices
+            rows_to_drop = []
             
             # Parse and append new trades
             new_trades = []
-            for filepath in new_files:
-                file_basename = os.path.basename(filepath)
-                print(f"   Parsing {file_basename}...")
-                file_df = parse_trade_file(filepath)
-                
+            parsed_files = parse_trade_files(new_files)
+            for filepath, file_basename, file_df in zip(new_files, new_file_basenames, parsed_files):
                 if file_df is not None and not file_df.empty:
                     # Check if trades from this file already exist in tradebook
-                    existing_from_file = df[df['Source_File'] == file_basename]
+                    existing_rows = rows_by_file.get(file_basename, [])
+                    
+                    # Update metadata using new format
+                    metadata[file_basename] = make_metadata_entry(file_mtimes[filepath])
                     
-                    if len(existing_from_file) > 0:
-                        print(f"   ⚠️  Found {len(existing_from_file)} existing trades from {file_basename}")
+                    # Touched but unchanged files keep their existing trades (and exchange rates)
+                    if len(existing_rows) > 0 and trades_match_existing(file_df, df.iloc[existing_rows]):
+                        print(f"   ℹ️ No changes in {file_basename}")
+                        continue
+                    
+                    if len(existing_rows) > 0:
+                        print(f"   ⚠️  Found {len(existing_rows)} existing trades from {file_basename}")
                         print(f"   🔍 Checking for duplicates...")
                         
                         # Remove existing trades from this file to avoid duplicates
-                        df = df[df['Source_File'] != file_basename]
+                        rows_to_drop.append(existing_rows)
                         print(f"   🗑️  Removed existing trades from {file_basename}")
                     
                     new_trades.append(file_df)
-                    # Update metadata using new format
-                    metadata[file_basename] = get_file_modification_time_string(filepath)
+            
+            # Drop all replaced trades at once
+            if rows_to_drop:
+                df = df.drop(df.index[np.concatenate(rows_to_drop)])
             
             if new_trades:
                 # Combine new trades
@@ -370,20 +743,17 @@ def load_or_create_tradebook():
                 # Add exchange rates to new trades
                 new_df = add_exchange_rates_to_trades(new_df)
                 
-                # Append to existing tradebook
-                df = pd.concat([df, new_df], ignore_index=True)
-                
-                # Sort by date to keep chronological order
-                df['Date'] = pd.to_datetime(df['Date'])
-                df = df.sort_values('Date').reset_index(drop=True)
-                df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+                # Merge into the existing tradebook, keeping chronological order
+                df = merge_trades_by_date(df, new_df)
                 
                 # Save updated tradebook
-                df.to_csv(TRADEBOOK_FILE, index=False)
+                write_tradebook(df)
                 save_processed_files_metadata(metadata)
                 
                 print(f"✅ Updated tradebook: {len(df)} total trades")
             else:
+                # Tradebook is unchanged; only record the new mtimes so the files aren't re-checked
+                save_processed_files_metadata(metadata)
                 print("   ℹ️ No new trades found in modified files")
         else:
             print("✅ Tradebook is up to date")
@@ -395,14 +765,12 @@ def load_or_create_tradebook():
         print(f"🔨 Creating new tradebook from {len(trade_files)} source file(s)...")
         
         all_trades = []
-        for filepath in trade_files:
-            print(f"   Parsing {os.path.basename(filepath)}...")
-            file_df = parse_trade_file(filepath)
-            
+        parsed_files = parse_trade_files(trade_files)
+        for filepath, file_df in zip(trade_files, parsed_files):
             if file_df is not None and not file_df.empty:
                 all_trades.append(file_df)
                 # Update metadata using new format
-                metadata[os.path.basename(filepath)] = get_file_modification_time_string(filepath)
+                metadata[os.path.basename(filepath)] = make_metadata_entry(file_mtimes[filepath])
         
         if not all_trades:
             print("⚠️ No trade data found in source files")
@@ -418,7 +786,7 @@ def load_or_create_tradebook():
         df = add_exchange_rates_to_trades(df)
         
         # Save tradebook
-        df.to_csv(TRADEBOOK_FILE, index=False)
+        write_tradebook(df)
         save_processed_files_metadata(metadata)
         
         print(f"✅ Created tradebook: {len(df)} trades")
@@ -430,55 +798,165 @@ def load_or_create_tradebook():
 # SGB PRICE CACHING
 # ============================================================================
 
+def migrate_sgb_cache_timestamps(cache):
+    """Convert legacy ISO 'timestamp' strings to Unix epoch 'ts' floats, in place"""
+    for data in cache.values():
+        if isinstance(data, dict) and 'ts' not in data and 'timestamp' in data:
+            try:
+                data['ts'] = datetime.fromisoformat(data.pop('timestamp')).timestamp()
+            except (TypeError, ValueError):
+                pass  # Unparseable: the entry has no 'ts' and counts as expired
+
+
+def sgb_cache_path():
+    """
+    Path of the SGB price cache file to read, or None when there is none.
+    With msgpack installed an older sgb_price_cache.json is still read until
+    the next save migrates it to SGB_PRICE_CACHE_FILE.
+    """
+    for path in (SGB_PRICE_CACHE_FILE, SGB_PRICE_CACHE_JSON_FILE):
+        if os.path.exists(path):
+            return path
+    return None
+
+
 def load_sgb_cache():
-    """Load the SGB price cache from JSON file"""
-    if os.path.exists(SGB_PRICE_CACHE_FILE):
-        try:
-            with open(SGB_PRICE_CACHE_FILE, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"⚠️ Warning: Could not read {SGB_PRICE_CACHE_FILE}, starting fresh")
-            return {}
+    """
+    Load the SGB price cache file (msgpack, or JSON for older caches and installs without msgpack).
+    The parsed dict is kept in memory and reused until the file's mtime changes.
+    """
+    global _sgb_cache_obj, _sgb_cache_mtime
+    
+    path = sgb_cache_path()
+    if path is None:
+        return {}
+    
+    try:
+        mtime = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+    
+    if mtime == _sgb_cache_mtime:
+        return _sgb_cache_obj
+    
+    try:
+        if path == SGB_PRICE_CACHE_JSON_FILE:
+            cache = read_json_file(path)
+        else:
+            with open(path, 'rb') as f:
+                cache = msgpack.unpackb(f.read(), raw=False)
+        
+        migrate_sgb_cache_timestamps(cache)
+        _sgb_cache_obj, _sgb_cache_mtime = cache, mtime
+        return cache
+    except ValueError:
+        # json.JSONDecodeError and msgpack's unpack errors are ValueErrors
+        pass
+    
+    print(f"⚠️ Warning: Could not read {path}, starting fresh")
     return {}
 
 
 def save_sgb_cache(cache):
-    """Save the SGB price cache to JSON file"""
-    with open(SGB_PRICE_CACHE_FILE, 'w') as f:
-        json.dump(cache, f, indent=2)
+    """Save the SGB price cache as msgpack, or compact JSON when msgpack is not installed"""
+    global _sgb_cache_obj, _sgb_cache_mtime
+    
+    if msgpack is not None:
+        with open(SGB_PRICE_CACHE_FILE, 'wb') as f:
+            f.write(msgpack.packb(cache, use_bin_type=True))
+        
+        # The JSON cache has been migrated; drop it so it can't be read again after a clear
+        if os.path.exists(SGB_PRICE_CACHE_JSON_FILE):
+            os.remove(SGB_PRICE_CACHE_JSON_FILE)
+    else:
+        write_json_file(SGB_PRICE_CACHE_FILE, cache, compact=True)
+    
+    # What we just wrote is what the next load would parse
+    _sgb_cache_obj = cache
+    _sgb_cache_mtime = (SGB_PRICE_CACHE_FILE, os.stat(SGB_PRICE_CACHE_FILE).st_mtime_ns)
 
 
-def is_cache_valid(cached_time_str, validity_hours=CACHE_VALIDITY_HOURS):
-    """Check if cached data is still valid based on timestamp"""
-    try:
-        cached_time = datetime.fromisoformat(cached_time_str)
-        age = datetime.now() - cached_time
-        return age.total_seconds() < (validity_hours * 3600)
-    except Exception:
+def flush_sgb_cache():
+    """Write prices fetched with flush=False to the SGB cache file in a single save"""
+    with _sgb_cache_lock:
+        if not _pending_sgb_prices:
+            return
+        
+        cache = load_sgb_cache()
+        cache.update(_pending_sgb_prices)
+        save_sgb_cache(cache)
+        _pending_sgb_prices.clear()
+
+
+atexit.register(flush_sgb_cache)
+
+
+def is_cache_valid(cached_ts, validity_hours=CACHE_VALIDITY_HOURS, now=None):
+    """Check if cached data is still valid based on its Unix timestamp"""
+    if not isinstance(cached_ts, (int, float)):
         return False
+    if now is None:
+        now = time.time()
+    return (now - cached_ts) < (validity_hours * 3600)
 
 
-def fetch_sgb_price_from_nse(ticker):
+# Shared NSE session: connections are reused across requests and threads
+_nse_session = requests.Session()
+# NSE requires proper headers to avoid being blocked
+_nse_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json',
+    'Accept-Language': 'en-US,en;q=0.9',
+})
+# Transient throttling/server errors are retried with exponential backoff before giving up
+_nse_session.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'])
+))
+
+# At most NSE_MAX_WORKERS requests start within any NSE_REQUEST_INTERVAL window
+_nse_request_slots = threading.Semaphore(NSE_MAX_WORKERS)
+
+
+def _wait_for_nse_request_slot():
+    """Take a request slot; it is released again NSE_REQUEST_INTERVAL seconds later"""
+    _nse_request_slots.acquire()
+    release_timer = threading.Timer(NSE_REQUEST_INTERVAL, _nse_request_slots.release)
+    release_timer.daemon = True
+    release_timer.start()
+
+
+def fetch_sgb_quote_from_nse(ticker, etag=None, last_modified=None):
     """
-    Fetch current SGB price from NSE website
-    Returns price or None if failed
+    Fetch current SGB price from NSE website, as a conditional request when
+    validators from an earlier response are given.
+    
+    Returns:
+        Dict with 'price', 'etag' and 'last_modified', plus 'not_modified': True when
+        NSE answered 304 (price is then None - the cached one is still current).
+        None if the fetch failed.
     """
     try:
-        # NSE requires proper headers to avoid being blocked
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json',
-            'Accept-Language': 'en-US,en;q=0.9',
-        }
-        
         # The NSE API endpoint for bond quotes
         # Note: NSE API structure may change, this is a common pattern
         url = f"https://www.nseindia.com/api/quote-equity?symbol={ticker}"
         
-        # Add a small delay to be respectful to NSE servers
-        time.sleep(0.5)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        # Rate-limit requests to be respectful to NSE servers
+        _wait_for_nse_request_slot()
+        
+        response = _nse_session.get(url, headers=headers, timeout=10)
+        
+        if response.status_code == 304:
+            return {'price': None, 'etag': etag, 'last_modified': last_modified, 'not_modified': True}
         
-        response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         data = response.json()
@@ -490,17 +968,42 @@ def fetch_sgb_price_from_nse(ticker):
         elif 'lastPrice' in data:
             price = data['lastPrice']
         
-        if price is not None:
-            return float(price)
+        if price is None:
+            return None
         
-        return None
+        return {
+            'price': float(price),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'not_modified': False
+        }
     
     except Exception as e:
         print(f"⚠️ Could not fetch SGB price from NSE for {ticker}: {e}")
         return None
 
 
-def get_sgb_price_cached(ticker, df=None):
+def fetch_sgb_price_from_nse(ticker):
+    """
+    Fetch current SGB price from NSE website
+    Returns price or None if failed
+    """
+    quote = fetch_sgb_quote_from_nse(ticker)
+    return quote['price'] if quote is not None else None
+
+
+def _store_sgb_cache_entry(cache, ticker, flush):
+    """Persist cache[ticker] now, or queue it for the next flush_sgb_cache()"""
+    with _sgb_cache_lock:
+        if flush:
+            # cache already includes any queued entries, so they are written too
+            save_sgb_cache(cache)
+            _pending_sgb_prices.clear()
+        else:
+            _pending_sgb_prices[ticker] = cache[ticker]
+
+
+def get_sgb_price_cached(ticker, df=None, flush=True, now=None):
     """
     Get SGB price with caching.
     First checks cache, if expired or missing, fetches from NSE.
@@ -509,29 +1012,56 @@ def get_sgb_price_cached(ticker, df=None):
     Args:
         ticker: The SGB ticker symbol
         df: Optional DataFrame of trades to use as fallback
+        flush: Write the cache file immediately. Pass False when looking up many
+               tickers and call flush_sgb_cache() once at the end of the batch.
+        now: Optional Unix time of the batch, used to check and stamp cache entries
     
     Returns:
         Price as float or None if not available
     """
-    cache = load_sgb_cache()
+    if now is None:
+        now = time.time()
+    
+    with _sgb_cache_lock:
+        cache = load_sgb_cache()
+        cache.update(_pending_sgb_prices)
     
     # Check if we have a valid cached price
-    if ticker in cache and 'timestamp' in cache[ticker]:
-        if is_cache_valid(cache[ticker]['timestamp']):
+    if ticker in cache and 'ts' in cache[ticker]:
+        if is_cache_valid(cache[ticker]['ts'], now=now):
             price = cache[ticker].get('price')
             if price is not None:
                 return float(price)
     
-    # Cache is expired or missing, fetch fresh price
-    price = fetch_sgb_price_from_nse(ticker)
+    # Cache is expired or missing, fetch fresh price.
+    # A real NSE price cached earlier lets us ask NSE whether it changed.
+    cached_entry = cache.get(ticker, {})
+    revalidate = cached_entry.get('price') is not None and not cached_entry.get('fallback', False)
+    quote = fetch_sgb_quote_from_nse(
+        ticker,
+        etag=cached_entry.get('etag') if revalidate else None,
+        last_modified=cached_entry.get('last_modified') if revalidate else None
+    )
+    
+    if quote is not None and quote['not_modified']:
+        # Unchanged on NSE: keep the cached price and restart its validity window
+        cache[ticker] = dict(cached_entry, ts=now)
+        _store_sgb_cache_entry(cache, ticker, flush)
+        return float(cached_entry['price'])
+    
+    price = quote['price'] if quote is not None else None
     
     if price is not None:
-        # Cache the fresh price
+        # Cache the fresh price along with the validators for the next refresh
         cache[ticker] = {
             'price': price,
-            'timestamp': datetime.now().isoformat()
+            'ts': now
         }
-        save_sgb_cache(cache)
+        if quote['etag']:
+            cache[ticker]['etag'] = quote['etag']
+        if quote['last_modified']:
+            cache[ticker]['last_modified'] = quote['last_modified']
+        _store_sgb_cache_entry(cache, ticker, flush)
         return price
     else:
         # Fallback to last known price from trades if available
@@ -544,10 +1074,10 @@ def get_sgb_price_cached(ticker, df=None):
                 # Cache the fallback price (it's better than nothing)
                 cache[ticker] = {
                     'price': price,
-                    'timestamp': datetime.now().isoformat(),
+                    'ts': now,
                     'fallback': True
                 }
-                save_sgb_cache(cache)
+                _store_sgb_cache_entry(cache, ticker, flush)
                 return price
             except Exception:
                 pass
@@ -560,10 +1090,39 @@ def get_sgb_price_cached(ticker, df=None):
         return None
 
 
+def fetch_sgb_prices_bulk(tickers, df=None):
+    """
+    Get cached-or-fresh prices for several SGBs, fetching from NSE concurrently.
+    The cache file is written once at the end instead of after every ticker.
+    
+    Args:
+        tickers: Iterable of SGB ticker symbols
+        df: Optional DataFrame of trades to use as fallback
+    
+    Returns:
+        Dict of ticker -> price (None if not available)
+    """
+    tickers = list(dict.fromkeys(tickers))
+    
+    # One clock reading for the whole batch
+    now = time.time()
+    
+    with ThreadPoolExecutor(max_workers=NSE_MAX_WORKERS) as executor:
+        prices = list(executor.map(lambda ticker: get_sgb_price_cached(ticker, df, flush=False, now=now), tickers))
+    
+    flush_sgb_cache()
+    return dict(zip(tickers, prices))
+
+
 def clear_sgb_cache():
     """Clear the SGB price cache"""
-    if os.path.exists(SGB_PRICE_CACHE_FILE):
-        os.remove(SGB_PRICE_CACHE_FILE)
+    global _sgb_cache_obj, _sgb_cache_mtime
+    
+    cache_files = [path for path in {SGB_PRICE_CACHE_FILE, SGB_PRICE_CACHE_JSON_FILE} if os.path.exists(path)]
+    if cache_files:
+        for path in cache_files:
+            os.remove(path)
+        _sgb_cache_obj, _sgb_cache_mtime = None, None
         print(f"✅ Cleared SGB price cache")
     else:
         print(f"ℹ️  No SGB price cache found")
@@ -571,7 +1130,7 @@ def clear_sgb_cache():
 
 def show_sgb_cache_status():
     """Show the current SGB cache status"""
-    if not os.path.exists(SGB_PRICE_CACHE_FILE):
+    if sgb_cache_path() is None:
         print("❌ No SGB price cache found")
         return
     
@@ -581,23 +1140,21 @@ def show_sgb_cache_status():
     print(f"   Total cached tickers: {len(cache)}")
     print()
     
-    now = datetime.now()
+    now = time.time()
     
     for ticker, data in sorted(cache.items()):
         price = data.get('price', 'N/A')
-        timestamp_str = data.get('timestamp', '')
+        cached_ts = data.get('ts')
         is_fallback = data.get('fallback', False)
         
-        try:
-            timestamp = datetime.fromisoformat(timestamp_str)
-            age = now - timestamp
-            age_str = f"{age.total_seconds() / 3600:.1f} hours ago"
+        if isinstance(cached_ts, (int, float)):
+            age_str = f"{(now - cached_ts) / 3600:.1f} hours ago"
             
-            if is_cache_valid(timestamp_str):
+            if is_cache_valid(cached_ts, now=now):
                 status = "✅ VALID"
             else:
                 status = "⏰ EXPIRED"
-        except Exception:
+        else:
             age_str = "Unknown"
             status = "❓ INVALID"
         
@@ -614,17 +1171,21 @@ def tradebook_status():
     print("📊 Tradebook Status")
     print("=" * 60)
     
-    if os.path.exists(TRADEBOOK_FILE):
-        tradebook_size = os.path.getsize(TRADEBOOK_FILE)
-        tradebook_mtime = os.path.getmtime(TRADEBOOK_FILE)
-        tradebook_date = datetime.fromtimestamp(tradebook_mtime).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        tradebook_stat = os.stat(TRADEBOOK_FILE)
+    except FileNotFoundError:
+        tradebook_stat = None
+    
+    if tradebook_stat is not None:
+        tradebook_size = tradebook_stat.st_size
+        tradebook_date = format_mtime(tradebook_stat.st_mtime)
         
         print(f"✅ Tradebook exists: {TRADEBOOK_FILE}")
         print(f"   Size: {tradebook_size:,} bytes")
         print(f"   Last modified: {tradebook_date}")
         
         try:
-            df = pd.read_csv(TRADEBOOK_FILE)
+            df = pd.read_csv(TRADEBOOK_FILE, engine=CSV_ENGINE)
             print(f"   Total trades: {len(df):,}")
             if 'Date' in df.columns:
                 print(f"   Date range: {df['Date'].min()} to {df['Date'].max()}")
@@ -646,8 +1207,7 @@ def tradebook_status():
         print()
         print("   Already processed:")
         for file_key in sorted(metadata.keys()):
-            # Metadata is now simply a string in 'YYYY-MM-DD HH:MM:SS' format
-            mtime_str = metadata[file_key]
+            mtime_str = metadata[file_key]['iso']
             
             full_path = os.path.join(WORKING_DIR, file_key)
             exists = "✅" if os.path.exists(full_path) else "🗑️ (deleted)"
@@ -657,7 +1217,8 @@ def tradebook_status():
     
     print()
     print("📁 Current Source Trade Files:")
-    trade_files = get_trade_files()
+    file_mtimes = scan_trade_files()
+    trade_files = list(file_mtimes)
     
     if trade_files:
         print(f"   Found {len(trade_files)} source trade file(s):")
@@ -665,23 +1226,14 @@ def tradebook_status():
         
         for filepath in sorted(trade_files):
             file_key = os.path.basename(filepath)
-            current_mtime = get_file_modification_time(filepath)
+            current_mtime = file_mtimes[filepath]
             
-            # Get stored timestamp string and convert for comparison
-            if file_key in metadata:
-                stored_time_str = metadata[file_key]
-                try:
-                    stored_dt = datetime.strptime(stored_time_str, '%Y-%m-%d %H:%M:%S')
-                    processed_mtime = stored_dt.timestamp()
-                except (ValueError, AttributeError):
-                    processed_mtime = 0
-            else:
-                processed_mtime = 0
+            processed_mtime = metadata[file_key]['mtime'] if file_key in metadata else 0
             
-            mtime_str = datetime.fromtimestamp(current_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            mtime_str = format_mtime(current_mtime)
             
-            # Add 1-second tolerance to handle timestamp precision differences
-            if current_mtime > processed_mtime + 1:
+            # Same comparison as identify_new_or_modified_files
+            if current_mtime > processed_mtime:
                 status = "🔄 NEW/MODIFIED - Will be processed"
             else:
                 status = "✅ Already processed"
@@ -703,6 +1255,11 @@ def clear_tradebook():
         deleted.append(TRADEBOOK_FILE)
         print(f"   ✅ Deleted {TRADEBOOK_FILE}")
     
+    if os.path.exists(TRADEBOOK_PARQUET_FILE):
+        os.remove(TRADEBOOK_PARQUET_FILE)
+        deleted.append(TRADEBOOK_PARQUET_FILE)
+        print(f"   ✅ Deleted {TRADEBOOK_PARQUET_FILE}")
+    
     if os.path.exists(PROCESSED_FILES_METADATA):
         os.remove(PROCESSED_FILES_METADATA)
         deleted.append(PROCESSED_FILES_METADATA)
@@ -785,7 +1342,7 @@ def show_help():
     print()
     print("Features:")
     print("  - Incremental file processing (only new/modified files)")
-    print("  - Exchange rate caching (USD/INR stored in tradebook)")
+    print("  - Exchange rate caching (USD/INR stored in tradebook and exchange_rate_cache.json)")
     print("  - SGB price caching (6-hour validity)")
     print("  - Persistent metadata tracking")
     print()
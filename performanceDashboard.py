@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 from datetime import date
-from portfolio_calculator import calculate_detailed_portfolio, format_indian_number
 
 # Check if logging is enabled via environment variable
 ENABLE_LOGGING = os.environ.get('ENABLE_LOGGING', 'false').lower() in ('true', '1', 'yes')
@@ -24,10 +24,207 @@ def nse_get_advances_declines(*args, **kwargs):
     log("⚠️ nsepython not available at import time: nse_get_advances_declines stub called")
     return None
 
+def tradebook_version():
+    """
+    Modification times of the tradebook and the year-end snapshot files.
+    Used as a cache key, so trade-derived data is only recalculated when one of them changes.
+    """
+    if not os.path.isdir('archivesCSV'):
+        return ()
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns)
+        for entry in os.scandir('archivesCSV')
+        if entry.name == 'tradebook.csv' or entry.name.startswith(('holdings_snapshot_', 'cashflows_snapshot_'))
+    ))
+
+@st.cache_data(max_entries=4)  # No TTL: keyed on tradebook_version instead
+def load_holdings_data(tradebook_version, force_recalc=False):
+    """Trade-derived holdings, realized profit and cash flows, plus the display-ready Trade Book"""
+    # Imported here so the page can render before the calculator's dependencies load
+    from portfolio_calculator import calculate_holdings
+    
+    holdings_data = calculate_holdings(force_full_recalc=force_recalc)
+    if holdings_data is None:
+        return None, None
+    
+    # Sort trades by date (most recent first) once here, not on every rerun;
+    # the tradebook table can still be re-sorted by clicking its column headers
+    df = holdings_data['df'].sort_values('Date', ascending=False).reset_index(drop=True)
+    # Internal columns dropped and dates formatted once, so pagination only slices rows
+    columns_to_drop = ['Is_SGB', 'Source_File', 'Country', 'Exchange_Rate']
+    df = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
+    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+    # Arrow-backed columns go to st.dataframe without a per-rerun conversion of the
+    # string columns; integer-valued floats stay floats so the table looks the same
+    df = df.convert_dtypes(dtype_backend='pyarrow', convert_integer=False)
+    return holdings_data, df
+
 @st.cache_data(ttl=300)  # Cache for 5 minutes (300 seconds)
+def load_market_data(held_tickers, _df):
+    """
+    Live prices for the held tickers, to avoid repeated API calls.
+    Keyed on the tickers only: the leading underscore keeps `_df` out of the cache key.
+    """
+    from portfolio_calculator import get_market_data
+    return get_market_data(_df, list(held_tickers))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def value_holdings(tradebook_version, force_recalc, _holdings_data, market_data, company_names, previous_close_data):
+    """
+    Holdings table and summary metrics for one set of holdings and prices.
+    `_holdings_data` is identified by the same (tradebook_version, force_recalc) key as
+    load_holdings_data, so reruns with unchanged prices skip the valuation and XIRR.
+    """
+    from portfolio_calculator import build_portfolio_table
+    
+    portfolio_df, summary_metrics = build_portfolio_table(
+        _holdings_data, market_data, company_names, previous_close_data
+    )
+    # Compact display dtypes for the text columns. Money columns stay float64:
+    # float32 can't hold 7-digit INR amounts to two decimals
+    portfolio_df = portfolio_df.astype({
+        'Ticker': 'string[pyarrow]',
+        'Name': 'string[pyarrow]',
+        'Currency': 'category'
+    })
+    return portfolio_df, summary_metrics
+
 def load_portfolio_data(force_recalc=False):
-    """Load and calculate portfolio data with caching to avoid repeated API calls"""
-    return calculate_detailed_portfolio(force_full_recalc=force_recalc)
+    """Value the cached holdings at the cached live prices"""
+    version = tradebook_version()
+    holdings_data, df = load_holdings_data(version, force_recalc)
+    if holdings_data is None:
+        return None, None, None
+    if not holdings_data['currently_held_tickers']:
+        return None, None, df
+    
+    market_data, company_names, previous_close_data = load_market_data(
+        tuple(holdings_data['currently_held_tickers']), holdings_data['df']
+    )
+    portfolio_df, summary_metrics = value_holdings(
+        version, force_recalc, holdings_data, market_data, company_names, previous_close_data
+    )
+    return portfolio_df, summary_metrics, df
+
+# Numeric columns of the holdings table, shown with two decimals
+HOLDINGS_NUMERIC_COLUMNS = [
+    "Qty", "Avg Buy Price", "Current Price", "Invested Value (INR)",
+    "Current Value (INR)", "P&L (INR)", "P/L %"
+]
+
+def highlight_pl_range(df):
+    """
+    Cell styles for the holdings table: rows where P/L% is between 5% and 10% in green,
+    rows with missing P/L% (no price data) in orange. Computed for all rows at once.
+    """
+    pl_values = df["P/L %"]
+    in_range = pl_values.between(5, 10, inclusive='both').to_numpy()
+    missing = pl_values.isna().to_numpy()
+    
+    row_styles = np.select(
+        [missing, in_range],
+        ['background-color: #FFA500; color: white',  # Orange for missing data
+         'background-color: #006400; color: white'],
+        default=''
+    )
+    return pd.DataFrame(
+        np.repeat(row_styles[:, None], len(df.columns), axis=1),
+        index=df.index,
+        columns=df.columns
+    )
+
+# Above this many holdings the table is drawn without a Styler: a status marker column
+# replaces the row colours and column_config does the number formatting
+STYLER_MAX_ROWS = 200
+
+def with_pl_status(portfolio_df):
+    """
+    Holdings table with a leading status column standing in for the row highlights:
+    ⚠️ for missing P/L% (no price data), 🟢 for P/L% between 5% and 10%
+    """
+    pl_values = portfolio_df["P/L %"]
+    status = np.where(
+        pl_values.isna(), '⚠️',
+        np.where(pl_values.between(5, 10, inclusive='both'), '🟢', '')
+    )
+    status_df = portfolio_df.copy()
+    status_df.insert(0, "Status", status)
+    return status_df
+
+@st.cache_data(ttl=300)
+def holdings_cell_styles(portfolio_df):
+    """
+    Per-cell highlight styles of the holdings table, computed once per portfolio,
+    so reruns (pagination clicks, buttons) don't restyle the table
+    """
+    return highlight_pl_range(portfolio_df)
+
+@st.fragment
+def render_tradebook(df, key='tradebook'):
+    """
+    Render the paginated Trade Book for a display-ready tradebook DataFrame
+    (sorted, internal columns dropped, dates formatted - see load_holdings_data).
+    `key` namespaces the session state and widget keys, so more than one page
+    can show a tradebook without sharing (or clashing on) the current page.
+    Runs as a fragment: paging reruns only this function, not the data loading
+    and holdings table above it.
+    """
+    page_key = f"{key}_page_number"
+    
+    st.subheader("📖 Trade Book")
+    
+    # Trades are already sorted by date (most recent first) in load_holdings_data
+    
+    # Pagination settings
+    rows_per_page = 100
+    total_trades = len(df)
+    total_pages = (total_trades - 1) // rows_per_page + 1
+    
+    # Page selector: the number input owns the current page in session state, and the
+    # buttons change it in on_click callbacks, which run before the script reruns -
+    # so a click or a jump re-renders once, with no explicit st.rerun()
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    # Keep the page in range if the tradebook got shorter
+    st.session_state[page_key] = min(max(st.session_state[page_key], 1), total_pages)
+    
+    def change_page(step):
+        st.session_state[page_key] = min(max(st.session_state[page_key] + step, 1), total_pages)
+    
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+    
+    with col1:
+        st.button("⬅️ Previous", key=f"{key}_previous", on_click=change_page, args=(-1,))
+    
+    with col2:
+        st.markdown(f"<h4 style='text-align: center;'>Page {st.session_state[page_key]} of {total_pages}</h4>", unsafe_allow_html=True)
+    
+    with col3:
+        st.button("Next ➡️", key=f"{key}_next", on_click=change_page, args=(1,))
+    
+    with col4:
+        st.number_input(
+            "Jump to page:",
+            min_value=1,
+            max_value=total_pages,
+            step=1,
+            key=page_key
+        )
+    
+    # Calculate start and end indices for current page
+    start_idx = (st.session_state[page_key] - 1) * rows_per_page
+    end_idx = min(start_idx + rows_per_page, total_trades)
+    
+    # Display paginated trades
+    page_data = df.iloc[start_idx:end_idx]
+    
+    # A fixed viewport of about 20 rows: st.dataframe's grid is already row-virtualized
+    # and only draws the rows in view, instead of laying out all 100 rows at once.
+    # Rows still reach the browser a page at a time (the built-in grid can't ask the
+    # server for row ranges), which the 100-row pager keeps small.
+    st.dataframe(page_data, width='stretch', height=738, hide_index=True)
+    
+    st.caption(f"Showing trades {start_idx + 1} to {end_idx} of {total_trades} total trades")
 
 # --- PAGE SETUP ---
 st.set_page_config(page_title="SV's Portfolio", layout="wide")
@@ -43,7 +240,8 @@ with col_recalc:
         st.rerun()
 with col_refresh:
     if st.button("💰 Refresh Prices", help="Fetch latest stock prices"):
-        st.cache_data.clear()
+        # Only prices changed: keep the trade-derived holdings cached
+        load_market_data.clear()
         st.session_state.pop('force_recalc', None)
         st.rerun()
 
@@ -54,17 +252,19 @@ try:
     
     with st.spinner('Loading portfolio data and fetching live prices...'):
         # Use the cached function to avoid refetching on every page change
-        portfolio_rows, summary_metrics, df = load_portfolio_data(force_recalc)
+        portfolio_df, summary_metrics, df = load_portfolio_data(force_recalc)
         
         # Clear force recalc flag after use
         if force_recalc:
             st.session_state.pop('force_recalc', None)
     
-    if not portfolio_rows or not summary_metrics or df is None:
+    if portfolio_df is None or portfolio_df.empty or not summary_metrics or df is None:
         st.error("❌ No portfolio data available. Please check your CSV files.")
         st.stop()
     
     # --- STEP 2: DISPLAY METRICS ---
+    from portfolio_calculator import format_indian_number
+    
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     col1.metric("Total Invested", f"₹{format_indian_number(summary_metrics['total_invested'])}")
     col2.metric("Current Value", f"₹{format_indian_number(summary_metrics['current_value'])}")
@@ -84,99 +284,60 @@ try:
     with tab1:
         st.subheader("Holdings Breakdown")
         
-        # Create DataFrame from portfolio rows
-        portfolio_df = pd.DataFrame(portfolio_rows)
-        
-        # Define a function to highlight rows where P/L% is between 5% and 10%
-        def highlight_pl_range(row):
-            pl_value = row["P/L %"]
-            # Skip highlighting if P/L% is NaN (missing price data)
-            if pd.isna(pl_value):
-                return ['background-color: #FFA500; color: white'] * len(row)  # Orange for missing data
-            elif 5 <= pl_value <= 10:
-                return ['background-color: #006400; color: white'] * len(row)
-            else:
-                return [''] * len(row)
-        
-        # Apply styling and format numeric columns
-        styled_df = portfolio_df.style.apply(highlight_pl_range, axis=1).format({
-            "Qty": "{:.2f}",
-            "Avg Buy Price": "{:.2f}",
-            "Current Price": lambda x: "N/A" if pd.isna(x) else f"{x:.2f}",
-            "Invested Value (INR)": "{:.2f}",
-            "Current Value (INR)": lambda x: "N/A" if pd.isna(x) else f"{x:.2f}",
-            "P&L (INR)": lambda x: "N/A" if pd.isna(x) else f"{x:.2f}",
-            "P/L %": lambda x: "N/A" if pd.isna(x) else f"{x:.2f}"
-        })
-        
         # Calculate dynamic height: header (38px) + rows (35px each) + padding (10px)
         table_height = min(38 + (len(portfolio_df) * 35) + 10, 2000)
-        st.dataframe(styled_df, width="stretch", height=table_height, hide_index=True)
+        use_styler = len(portfolio_df) <= STYLER_MAX_ROWS
+        
+        if use_styler:
+            # Highlight styles for the holdings table (cached per portfolio)
+            cell_styles = holdings_cell_styles(portfolio_df)
+            
+            # Apply the precomputed styling and format numeric columns with one format
+            # string; na_rep shows missing prices as N/A without a per-cell callback.
+            # Values stay numeric, so the columns still sort as numbers.
+            styled_df = portfolio_df.style.apply(lambda _: cell_styles, axis=None).format(
+                "{:.2f}", subset=HOLDINGS_NUMERIC_COLUMNS, na_rep="N/A"
+            )
+            st.dataframe(styled_df, width="stretch", height=table_height, hide_index=True)
+        else:
+            # Large portfolio: skip the Styler, mark rows with a status column and let
+            # the frontend format the numbers
+            column_config = {
+                col: st.column_config.NumberColumn(format="%.2f")
+                for col in HOLDINGS_NUMERIC_COLUMNS
+            }
+            column_config["P/L %"] = st.column_config.NumberColumn(format="%.2f%%")
+            column_config["Status"] = st.column_config.TextColumn("", width="small")
+            st.caption(
+                f"ℹ️ More than {STYLER_MAX_ROWS} holdings: row colours are replaced by the Status column "
+                "(⚠️ missing price data, 🟢 P/L % between 5% and 10%)."
+            )
+            st.dataframe(
+                with_pl_status(portfolio_df), width="stretch", height=table_height,
+                hide_index=True, column_config=column_config
+            )
         
         # Add a note about missing data
         missing_count = portfolio_df["Current Price"].isna().sum()
         if missing_count > 0:
-            st.warning(f"⚠️ {missing_count} holding(s) with missing price data (highlighted in orange). P/L and XIRR calculations exclude these holdings.")
+            marker = "highlighted in orange" if use_styler else "marked ⚠️, listed in orange below"
+            st.warning(f"⚠️ {missing_count} holding(s) with missing price data ({marker}). P/L and XIRR calculations exclude these holdings.")
+            
+            if not use_styler:
+                # Only the few rows without prices go through the Styler, so they keep the
+                # orange highlight without styling the whole large table
+                missing_df = portfolio_df[portfolio_df["P/L %"].isna()]
+                missing_styles = highlight_pl_range(missing_df)
+                st.dataframe(
+                    missing_df.style.apply(lambda _: missing_styles, axis=None).format(
+                        "{:.2f}", subset=HOLDINGS_NUMERIC_COLUMNS, na_rep="N/A"
+                    ),
+                    width="stretch", hide_index=True
+                )
     
     # --- TAB 2: TRADEBOOK ---
     with tab2:
-        st.subheader("📖 Trade Book")
-        
-        # Sort trades by date (most recent first)
-        df_sorted = df.sort_values('Date', ascending=False)
-        
-        # Pagination settings
-        rows_per_page = 100
-        total_trades = len(df_sorted)
-        total_pages = (total_trades - 1) // rows_per_page + 1
-        
-        # Page selector
-        if 'page_number' not in st.session_state:
-            st.session_state.page_number = 1
-        
-        col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
-        
-        with col1:
-            if st.button("⬅️ Previous") and st.session_state.page_number > 1:
-                st.session_state.page_number -= 1
-                st.rerun()
-        
-        with col2:
-            st.markdown(f"<h4 style='text-align: center;'>Page {st.session_state.page_number} of {total_pages}</h4>", unsafe_allow_html=True)
-        
-        with col3:
-            if st.button("Next ➡️") and st.session_state.page_number < total_pages:
-                st.session_state.page_number += 1
-                st.rerun()
-        
-        with col4:
-            jump_to_page = st.number_input(
-                "Jump to page:",
-                min_value=1,
-                max_value=total_pages,
-                value=st.session_state.page_number,
-                step=1,
-                key="page_jump"
-            )
-            if jump_to_page != st.session_state.page_number:
-                st.session_state.page_number = jump_to_page
-                st.rerun()
-        
-        # Calculate start and end indices for current page
-        start_idx = (st.session_state.page_number - 1) * rows_per_page
-        end_idx = min(start_idx + rows_per_page, total_trades)
-        
-        # Display paginated trades
-        page_data = df_sorted.iloc[start_idx:end_idx].copy()
-        page_data['Date'] = page_data['Date'].dt.strftime('%Y-%m-%d')
-        
-        # Remove internal columns
-        columns_to_drop = ['Is_SGB', 'Source_File', 'Country', 'Exchange_Rate']
-        page_data = page_data.drop(columns=[col for col in columns_to_drop if col in page_data.columns])
-        
-        st.dataframe(page_data, width='stretch', height=3540, hide_index=True)
-        
-        st.caption(f"Showing trades {start_idx + 1} to {end_idx} of {total_trades} total trades")
+        render_tradebook(df)
 
 except Exception as e:
     st.error(f"❌ Error: {str(e)}")
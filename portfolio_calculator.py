@@ -2,6 +2,7 @@
 Portfolio Summary Calculator Module
 Extracts portfolio calculation logic for reuse in dashboard and Telegram notifications
 """
+import functools
 import warnings
 import logging
 import os
@@ -22,17 +23,40 @@ def log(message):
     if ENABLE_LOGGING:
         print(message)
 
+import numpy as np
 import pandas as pd
-from pyxirr import xirr
+from pyxirr import xirr, InvalidPaymentsError
 from datetime import date, datetime
 import glob
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 import time
 
+# Use the multi-threaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
+# JIT-compile the FIFO kernel when numba is installed; otherwise run it as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
 # Import price fetching functions from centralized module
 from price_fetcher import (
     fetch_price_with_fallback,
+    fetch_prices_from_yfinance_batch,
     load_backup_prices,
     save_backup_prices,
     fetch_sgb_price
@@ -44,7 +68,14 @@ load_dotenv()
 
 def format_indian_number(number):
     """Format number with Indian numbering system (lakhs and crores)"""
-    s = str(int(round(number)))
+    # Only the rounded rupee amount matters, so repeated values hit the cache
+    return _format_indian_int(int(round(number)))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_indian_int(value):
+    """Indian-style digit grouping of an integer; cached by format_indian_number"""
+    s = str(value)
     if len(s) <= 3:
         return s
     
@@ -97,6 +128,16 @@ def get_exchange_rate(currency, trade_date):
             return fallback_rate
 
 
+# Numeric columns of tradebook.csv and of the holdings snapshots
+TRADE_NUMERIC_DTYPES = {'Qty': 'float64', 'Price': 'float64', 'Exchange_Rate': 'float64'}
+# tradebook.csv columns that are neither used in calculations nor shown in the Trade Book
+TRADE_UNUSED_COLUMNS = ('Country', 'Source_File')
+SNAPSHOT_NUMERIC_DTYPES = {
+    'Qty': 'float64', 'Avg_Buy_Price': 'float64', 'Total_Invested_INR': 'float64',
+    'Realized_Profit_INR': 'float64', 'Exchange_Rate': 'float64'
+}
+
+
 def load_trade_data():
     """Load tradebook.csv as-is without any processing or updates"""
     # Simply load the tradebook CSV file directly
@@ -111,13 +152,26 @@ def load_trade_data():
         )
     
     log(f"📂 Loading {tradebook_file}...")
-    df = pd.read_csv(tradebook_file)
+    # Skip the columns nothing downstream reads; numeric columns fixed to float64 here,
+    # so the calculations never re-coerce them
+    header = pd.read_csv(tradebook_file, nrows=0).columns
+    df = pd.read_csv(
+        tradebook_file,
+        engine=CSV_ENGINE,
+        usecols=[col for col in header if col not in TRADE_UNUSED_COLUMNS],
+        dtype=TRADE_NUMERIC_DTYPES
+    )
     log(f"   Loaded {len(df)} trades")
     
     # Apply standard transformations
     df['Type'] = df['Type'].str.upper()
     df['Date'] = pd.to_datetime(df['Date'])
     
+    # Repeated strings as categories: compact, and compared by integer code
+    for column in ('Ticker', 'Type', 'Currency'):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    
     # Verify required columns exist
     required_columns = ['Date', 'Ticker', 'Type', 'Qty', 'Price', 'Currency', 'Exchange_Rate']
     missing_columns = [col for col in required_columns if col not in df.columns]
@@ -128,6 +182,20 @@ def load_trade_data():
             f"   Please rebuild the tradebook: python3 tradebook_builder.py rebuild"
         )
     
+    # Trades without a ticker can't belong to any holding. Leave them out here, since
+    # the per-ticker reductions number tickers with pd.factorize (code -1 for a missing one)
+    missing_ticker = df['Ticker'].isna().to_numpy()
+    if missing_ticker.any():
+        log(f"⚠️  Skipping {missing_ticker.sum()} trades with no Ticker:")
+        log(df[missing_ticker].to_string())
+        df = df[~missing_ticker].reset_index(drop=True)
+    
+    # Validate the numeric columns once instead of guarding every calculation
+    invalid_rows = df[df[list(TRADE_NUMERIC_DTYPES)].isna().any(axis=1)]
+    if not invalid_rows.empty:
+        log(f"⚠️  {len(invalid_rows)} trades have missing Qty/Price/Exchange_Rate values:")
+        log(invalid_rows.to_string())
+    
     return df
 
 
@@ -162,7 +230,7 @@ def get_latest_snapshot(snapshot_dir='archivesCSV'):
     latest_file, latest_year = max(snapshots_with_years, key=lambda x: x[1])
     
     log(f"📸 Loading snapshot: {os.path.basename(latest_file)}")
-    snapshot_df = pd.read_csv(latest_file)
+    snapshot_df = pd.read_csv(latest_file, engine=CSV_ENGINE, dtype=SNAPSHOT_NUMERIC_DTYPES)
     log(f"   Snapshot date: {latest_year}-12-31")
     log(f"   Holdings in snapshot: {len(snapshot_df)} tickers")
     
@@ -207,16 +275,19 @@ def load_trade_data_with_snapshot(force_full_recalc=False):
             - cash_flows: Historical cash flows from snapshot (or None)
             - cash_flow_dates: Historical cash flow dates from snapshot (or None)
     """
-    # Load full tradebook (always needed for display)
-    df = load_trade_data()
-    
     # Check if we should use snapshots
     if force_full_recalc:
+        # Load full tradebook (always needed for display)
+        df = load_trade_data()
         log("🔄 Force recalculation enabled - processing full tradebook")
         return df, None, None, df, None, None
     
-    # Try to load latest snapshot (with cash flows)
-    snapshot_df, snapshot_year, cash_flows, cash_flow_dates = get_latest_snapshot()
+    # Load the latest snapshot (with cash flows) on a worker thread while the full
+    # tradebook loads here; both CSV parsers release the GIL, so the reads overlap
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        snapshot_future = executor.submit(get_latest_snapshot)
+        df = load_trade_data()
+        snapshot_df, snapshot_year, cash_flows, cash_flow_dates = snapshot_future.result()
     
     if snapshot_df is None or snapshot_year is None:
         log("⚠️  No snapshots found - processing full tradebook")
@@ -238,19 +309,17 @@ def load_trade_data_with_snapshot(force_full_recalc=False):
 
 def get_currently_held_tickers(df):
     """Get list of tickers that are currently held"""
-    ticker_list = df['Ticker'].unique().tolist()
-    currently_held_tickers = []
-
-    for ticker in ticker_list:
-        ticker_trades = df[df['Ticker'] == ticker]
-        buy_qty = ticker_trades[ticker_trades['Type'] == 'BUY']['Qty'].sum()
-        sell_qty = ticker_trades[ticker_trades['Type'] == 'SELL']['Qty'].sum()
-        current_qty = buy_qty - sell_qty
-        
-        if current_qty >= 0.02:
-            currently_held_tickers.append(ticker)
+    # One pass over the tradebook: BUY/SELL quantities summed per ticker code,
+    # tickers kept in order of first appearance
+    trade_types = df['Type'].to_numpy()
+    qty = df['Qty'].to_numpy(dtype=np.float64)
+    ticker_codes, ticker_list = pd.factorize(df['Ticker'])
     
-    return currently_held_tickers
+    buy_qty = np.bincount(ticker_codes, weights=np.where(trade_types == 'BUY', qty, 0.0), minlength=len(ticker_list))
+    sell_qty = np.bincount(ticker_codes, weights=np.where(trade_types == 'SELL', qty, 0.0), minlength=len(ticker_list))
+    current_qty = buy_qty - sell_qty
+    
+    return list(ticker_list[current_qty >= 0.02])
 
 
 def get_market_data(df, currently_held_tickers):
@@ -259,20 +328,41 @@ def get_market_data(df, currently_held_tickers):
     company_names = {}
     previous_close_data = {}
     
-    # Load backup prices as fallback
-    backup_prices, prev_backup_prices = load_backup_prices()
-    
     # Track price sources for logging
     yahoo_success = []
     nse_success = []
     cached_used = []
     not_available = []
     
+    # SGB flag of each ticker's first trade, looked up once for all tickers
+    if 'Is_SGB' in df.columns:
+        sgb_flags = df.drop_duplicates('Ticker').set_index('Ticker')['Is_SGB']
+    else:
+        sgb_flags = pd.Series(False, index=pd.Index(currently_held_tickers, dtype=object))
+    
+    # Prices of all regular tickers in one batched yfinance download, on a worker thread
+    # while the SGB prices come from NSE here; tickers missing from the batch go through
+    # the per-ticker fallback below
+    regular_tickers = [ticker for ticker in currently_held_tickers if not sgb_flags[ticker]]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batch_future = executor.submit(fetch_prices_from_yfinance_batch, regular_tickers)
+        sgb_quotes = {
+            ticker: fetch_price_with_fallback(ticker, True)
+            for ticker in currently_held_tickers if sgb_flags[ticker]
+        }
+        batch_prices = batch_future.result()
+    if batch_prices:
+        save_backup_prices({ticker: quote[0] for ticker, quote in batch_prices.items()})
+    
     for ticker in currently_held_tickers:
-        is_sgb = df[df['Ticker'] == ticker]['Is_SGB'].iloc[0] if 'Is_SGB' in df.columns else False
-        
-        # Use the new unified price fetching function
-        price, company_name, prev_close, source = fetch_price_with_fallback(ticker, is_sgb)
+        if ticker in batch_prices:
+            price, company_name, prev_close = batch_prices[ticker]
+            source = 'yfinance'
+        elif ticker in sgb_quotes:
+            price, company_name, prev_close, source = sgb_quotes[ticker]
+        else:
+            # Not in the batch: per-ticker yfinance fetch with backup-price fallback
+            price, company_name, prev_close, source = fetch_price_with_fallback(ticker, False)
         
         if price is not None:
             market_data[ticker] = price
@@ -334,6 +424,48 @@ def get_market_data(df, currently_held_tickers):
     return market_data, company_names, previous_close_data
 
 
+@njit(cache=True)
+def fifo_avg_price_kernel(qty, price, is_buy, is_sell):
+    """
+    FIFO average buy price of the remaining lots for one ticker, on NumPy arrays of
+    trades already sorted by date (BUYs before SELLs on the same date).
+    Buy lots live in two parallel arrays; lots before `head` are fully consumed,
+    so sells never rescan them.
+    """
+    lot_qty = np.empty(len(qty))
+    lot_price = np.empty(len(qty))
+    n_lots = 0
+    head = 0  # Earliest lot that may still hold units
+    
+    for i in range(len(qty)):
+        if is_buy[i]:
+            lot_qty[n_lots] = qty[i]
+            lot_price[n_lots] = price[i]
+            n_lots += 1
+        elif is_sell[i]:
+            # Match sell against earliest remaining buy lots
+            sell_qty_remaining = qty[i]
+            while sell_qty_remaining > 0 and head < n_lots:
+                if lot_qty[head] > 0:
+                    qty_to_reduce = min(lot_qty[head], sell_qty_remaining)
+                    lot_qty[head] -= qty_to_reduce
+                    sell_qty_remaining -= qty_to_reduce
+                if lot_qty[head] <= 0:
+                    head += 1
+    
+    # Weighted average of remaining lots
+    total_qty = 0.0
+    total_value = 0.0
+    for j in range(head, n_lots):
+        if lot_qty[j] > 0:
+            total_qty += lot_qty[j]
+            total_value += lot_qty[j] * lot_price[j]
+    
+    if total_qty > 0:
+        return total_value / total_qty
+    return 0.0
+
+
 def calculate_fifo_avg_price(ticker_trades):
     """
     Calculate average buy price using FIFO (First In First Out) method.
@@ -346,35 +478,118 @@ def calculate_fifo_avg_price(ticker_trades):
     ticker_trades['Type_Sort'] = ticker_trades['Type'].map({'BUY': 0, 'SELL': 1})
     ticker_trades = ticker_trades.sort_values(['Date', 'Type_Sort']).reset_index(drop=True)
     
-    # Create a list of buy lots (each with qty and price) in chronological order
-    buy_lots = []
-    
-    # Process ALL trades in chronological order
-    for _, row in ticker_trades.iterrows():
-        if row['Type'] == 'BUY':
-            # Add new buy lot
-            buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-        elif row['Type'] == 'SELL':
-            # Match sell against earliest remaining buy lots (FIFO)
-            sell_qty_remaining = row['Qty']
-            
-            for lot in buy_lots:
-                if sell_qty_remaining <= 0:
-                    break
-                    
-                if lot['qty'] > 0:
-                    qty_to_reduce = min(lot['qty'], sell_qty_remaining)
-                    lot['qty'] -= qty_to_reduce
-                    sell_qty_remaining -= qty_to_reduce
+    trade_types = ticker_trades['Type'].to_numpy()
+    return float(fifo_avg_price_kernel(
+        ticker_trades['Qty'].to_numpy(dtype=np.float64),
+        ticker_trades['Price'].to_numpy(dtype=np.float64),
+        trade_types == 'BUY',
+        trade_types == 'SELL'
+    ))
+
+
+@njit(cache=True)
+def fifo_realized_profit_kernel(qty, price, is_buy, is_sell, fx_rate):
+    """
+    Realized profit (in INR) of one ticker's sells using FIFO, on NumPy arrays of
+    trades sorted by date. As in the original lot-list loops, every BUY is a lot
+    and each SELL is matched against the earliest lots that still hold units.
+    """
+    lot_qty = np.empty(len(qty))
+    lot_price = np.empty(len(qty))
+    n_lots = 0
+    for i in range(len(qty)):
+        if is_buy[i]:
+            lot_qty[n_lots] = qty[i]
+            lot_price[n_lots] = price[i]
+            n_lots += 1
     
-    # Calculate weighted average of remaining lots
-    total_qty = sum(lot['qty'] for lot in buy_lots if lot['qty'] > 0)
-    total_value = sum(lot['qty'] * lot['price'] for lot in buy_lots if lot['qty'] > 0)
+    realized_profit = 0.0
+    head = 0  # Earliest lot that may still hold units
+    for i in range(len(qty)):
+        if not is_sell[i]:
+            continue
+        sell_qty_remaining = qty[i]
+        while sell_qty_remaining > 0 and head < n_lots:
+            if lot_qty[head] > 0:
+                qty_to_match = min(lot_qty[head], sell_qty_remaining)
+                sell_revenue = qty_to_match * price[i] * fx_rate
+                sell_cost = qty_to_match * lot_price[head] * fx_rate
+                realized_profit += (sell_revenue - sell_cost)
+                lot_qty[head] -= qty_to_match
+                sell_qty_remaining -= qty_to_match
+            if lot_qty[head] <= 0:
+                head += 1
     
-    if total_qty > 0:
-        return total_value / total_qty
-    else:
-        return 0
+    return realized_profit
+
+
+def calculate_fifo_realized_profit(sorted_trades, fx_rate):
+    """
+    Calculate realized profit (INR) of one ticker's trades using FIFO.
+    `sorted_trades` must already be sorted by date; every sell is matched against
+    the buy lots in order, at the ticker's exchange rate `fx_rate`.
+    """
+    trade_types = sorted_trades['Type'].to_numpy()
+    return float(fifo_realized_profit_kernel(
+        sorted_trades['Qty'].to_numpy(dtype=np.float64),
+        sorted_trades['Price'].to_numpy(dtype=np.float64),
+        trade_types == 'BUY',
+        trade_types == 'SELL',
+        float(fx_rate)
+    ))
+
+
+@njit(cache=True)
+def fifo_grouped_kernel(qty, price, is_buy, is_sell, fx_rates, starts, ends):
+    """
+    FIFO average buy price and realized profit of many tickers in one call. Each ticker's
+    trades are the slice starts[g]:ends[g] of arrays sorted by ticker, then date, with
+    BUYs before SELLs on the same date; fx_rates holds one exchange rate per ticker.
+    """
+    n_groups = len(starts)
+    avg_prices = np.zeros(n_groups)
+    realized_profits = np.zeros(n_groups)
+    for g in range(n_groups):
+        s, e = starts[g], ends[g]
+        avg_prices[g] = fifo_avg_price_kernel(qty[s:e], price[s:e], is_buy[s:e], is_sell[s:e])
+        realized_profits[g] = fifo_realized_profit_kernel(
+            qty[s:e], price[s:e], is_buy[s:e], is_sell[s:e], fx_rates[g]
+        )
+    return avg_prices, realized_profits
+
+
+def calculate_fifo_by_ticker(trades):
+    """
+    FIFO average buy price and realized profit (INR) of every ticker in `trades`, from one
+    sort of the whole frame and one kernel call over the per-ticker slices.
+    Each ticker is valued at the exchange rate of its first trade.
+    Returns a DataFrame indexed by ticker with avg_price and realized_profit columns.
+    """
+    ticker_codes, ticker_list = pd.factorize(trades['Ticker'])
+    first_rows = np.unique(ticker_codes, return_index=True)[1]
+    fx_rates = trades['Exchange_Rate'].to_numpy(dtype=np.float64)[first_rows]
+    trade_types = trades['Type'].to_numpy()
+    is_buy = trade_types == 'BUY'
+    is_sell = trade_types == 'SELL'
+    
+    # Ticker by ticker, by date, BUYs before SELLs on the same date (tradebook order on ties)
+    order = np.lexsort((~is_buy, trades['Date'].to_numpy(), ticker_codes))
+    starts = np.searchsorted(ticker_codes[order], np.arange(len(ticker_list)))
+    ends = np.append(starts[1:], len(order))
+    
+    avg_prices, realized_profits = fifo_grouped_kernel(
+        trades['Qty'].to_numpy(dtype=np.float64)[order],
+        trades['Price'].to_numpy(dtype=np.float64)[order],
+        is_buy[order],
+        is_sell[order],
+        fx_rates,
+        starts,
+        ends
+    )
+    return pd.DataFrame(
+        {'avg_price': avg_prices, 'realized_profit': realized_profits},
+        index=pd.Index(ticker_list, dtype=object)
+    )
 
 
 def apply_incremental_trades(snapshot_df, incremental_df, full_df=None, snapshot_year=None):
@@ -406,8 +621,16 @@ def apply_incremental_trades(snapshot_df, incremental_df, full_df=None, snapshot
     
     # Apply incremental trades
     if not incremental_df.empty:
-        for ticker in incremental_df['Ticker'].unique():
-            ticker_trades = incremental_df[incremental_df['Ticker'] == ticker].sort_values('Date')
+        # Pre-snapshot trades grouped by ticker once, for rebought tickers below
+        historical_by_ticker = {}
+        if full_df is not None and snapshot_year is not None:
+            snapshot_date = pd.Timestamp(f'{snapshot_year}-12-31 23:59:59')
+            historical_by_ticker = dict(tuple(
+                full_df[full_df['Date'] <= snapshot_date].groupby('Ticker', sort=False, observed=True)
+            ))
+        
+        for ticker, ticker_trades in incremental_df.groupby('Ticker', sort=False, observed=True):
+            ticker_trades = ticker_trades.sort_values('Date')
             
             # Initialize if new ticker
             if ticker not in holdings:
@@ -416,12 +639,8 @@ def apply_incremental_trades(snapshot_df, incremental_df, full_df=None, snapshot
                 # IMPORTANT: Calculate historical realized profit for rebought tickers
                 # If this ticker was sold before snapshot and rebought after, we need its historical profit
                 historical_realized_profit = 0.0
-                if full_df is not None and snapshot_year is not None:
-                    snapshot_date = pd.Timestamp(f'{snapshot_year}-12-31 23:59:59')
-                    historical_trades = full_df[
-                        (full_df['Ticker'] == ticker) & 
-                        (full_df['Date'] <= snapshot_date)
-                    ].sort_values('Date')
+                if ticker in historical_by_ticker:
+                    historical_trades = historical_by_ticker[ticker].sort_values('Date')
                     
                     if len(historical_trades) > 0:
                         # Check if it had sells before snapshot
@@ -429,28 +648,7 @@ def apply_incremental_trades(snapshot_df, incremental_df, full_df=None, snapshot
                         if has_historical_sells:
                             # Calculate realized profit from historical trades using FIFO
                             fx_rate_hist = historical_trades['Exchange_Rate'].iloc[0]
-                            buy_lots_hist = []
-                            
-                            for _, row in historical_trades.iterrows():
-                                if row['Type'] == 'BUY':
-                                    buy_lots_hist.append({'qty': row['Qty'], 'price': row['Price']})
-                            
-                            for _, row in historical_trades.iterrows():
-                                if row['Type'] == 'SELL':
-                                    sell_qty_remaining = row['Qty']
-                                    sell_price = row['Price']
-                                    
-                                    for lot in buy_lots_hist:
-                                        if sell_qty_remaining <= 0:
-                                            break
-                                        
-                                        if lot['qty'] > 0:
-                                            qty_to_match = min(lot['qty'], sell_qty_remaining)
-                                            sell_revenue = qty_to_match * sell_price * fx_rate_hist
-                                            sell_cost = qty_to_match * lot['price'] * fx_rate_hist
-                                            historical_realized_profit += (sell_revenue - sell_cost)
-                                            lot['qty'] -= qty_to_match
-                                            sell_qty_remaining -= qty_to_match
+                            historical_realized_profit = calculate_fifo_realized_profit(historical_trades, fx_rate_hist)
                 
                 holdings[ticker] = {
                     'qty': 0.0,
@@ -510,6 +708,88 @@ def apply_incremental_trades(snapshot_df, incremental_df, full_df=None, snapshot
     return holdings
 
 
+@functools.lru_cache(maxsize=32)
+def _xirr_cached(dates_bytes, amounts_bytes):
+    """
+    pyxirr XIRR keyed on the raw bytes of the date/amount arrays, so dashboard
+    reruns with unchanged cash flows and prices don't re-run the solver
+    """
+    return xirr(np.frombuffer(dates_bytes, dtype='datetime64[D]'), np.frombuffer(amounts_bytes, dtype=np.float64))
+
+
+def trade_cash_flows(trades, buys_before_sells=False, tickers=None):
+    """
+    XIRR cash flows of a trades DataFrame as NumPy arrays of INR amounts and dates:
+    BUYs negative, SELLs positive, each ticker valued at the exchange rate of its first trade.
+    Flows are grouped by ticker in order of first appearance and keep tradebook order
+    within a ticker (with buys_before_sells, a ticker's BUYs come before its SELLs).
+    `tickers` optionally limits the flows to those tickers.
+    """
+    trade_types = trades['Type'].to_numpy()
+    is_buy = trade_types == 'BUY'
+    is_sell = trade_types == 'SELL'
+    ticker_codes, _ = pd.factorize(trades['Ticker'])
+    first_rows = np.unique(ticker_codes, return_index=True)[1]
+    fx_rates = trades['Exchange_Rate'].to_numpy(dtype=np.float64)[first_rows]
+    trade_value = (trades['Qty'].to_numpy(dtype=np.float64) * trades['Price'].to_numpy(dtype=np.float64)
+                   * fx_rates[ticker_codes])
+    
+    is_flow = is_buy | is_sell
+    if tickers is not None:
+        is_flow &= trades['Ticker'].isin(list(tickers)).to_numpy()
+    flow_rows = np.flatnonzero(is_flow)
+    if buys_before_sells:
+        order = np.lexsort((flow_rows, is_sell[flow_rows], ticker_codes[flow_rows]))
+    else:
+        order = np.lexsort((flow_rows, ticker_codes[flow_rows]))
+    flow_rows = flow_rows[order]
+    
+    amounts = np.where(is_buy, -trade_value, trade_value)[flow_rows]
+    dates = trades['Date'].to_numpy()[flow_rows].astype('datetime64[D]')
+    return amounts, dates
+
+
+def calculate_xirr_percentage(cash_flows, cash_flow_dates, current_value_inr):
+    """
+    Portfolio XIRR in percent. `cash_flows`/`cash_flow_dates` are the trade cash flows
+    (lists or arrays); the current portfolio value is added as today's inflow.
+    Amounts and dates go to pyxirr as NumPy arrays. Returns 0 when XIRR can't be computed.
+    """
+    if current_value_inr <= 0:
+        log(f"⚠️  Current portfolio value is 0 - cannot calculate XIRR without end value")
+        return 0
+    
+    try:
+        amounts = np.append(np.asarray(cash_flows, dtype=np.float64), current_value_inr)
+        dates = np.append(np.asarray(cash_flow_dates, dtype='datetime64[D]'), np.datetime64(date.today(), 'D'))
+    except (ValueError, TypeError, OverflowError) as e:
+        log(f"⚠️ XIRR calculation error: invalid cash flows ({str(e)})")
+        return 0
+    
+    if len(amounts) < 2:
+        log(f"⚠️ Insufficient cash flows for XIRR: {len(amounts)} flows, {len(dates)} dates")
+        return 0
+    
+    # pyxirr needs both investments and returns; skip its guaranteed failure
+    if not (amounts < 0).any():
+        log(f"⚠️ XIRR calculation skipped: no investments (negative cash flows)")
+        return 0
+    
+    try:
+        portfolio_xirr = _xirr_cached(dates.tobytes(), amounts.tobytes())
+    except (InvalidPaymentsError, ValueError, TypeError, OverflowError) as e:
+        log(f"⚠️ XIRR calculation error: {str(e)}")
+        return 0
+    
+    # pyxirr returns None (or NaN) when the solver doesn't converge
+    if portfolio_xirr is not None and np.isfinite(portfolio_xirr) and portfolio_xirr != 0:
+        xirr_percentage = portfolio_xirr * 100
+        log(f"📈 XIRR calculated: {xirr_percentage:.2f}% (from {len(amounts)-1} transactions)")
+        return xirr_percentage
+    log(f"⚠️ XIRR calculation returned {portfolio_xirr}")
+    return 0
+
+
 def calculate_portfolio_summary(df=None):
     """
     Calculate complete portfolio summary including all metrics
@@ -530,66 +810,45 @@ def calculate_portfolio_summary(df=None):
         market_data, company_names, previous_close_data = get_market_data(df, currently_held_tickers)
         
         # Calculate metrics
-        ticker_list = df['Ticker'].unique().tolist()
         total_invested_inr = 0.0
         current_value_inr = 0.0
         previous_day_value_inr = 0.0
         total_realized_profit = 0.0
-        
-        cash_flows = []
-        cash_flow_dates = []
         holdings_count = 0
+        held_tickers = set(currently_held_tickers)
         
-        for ticker in ticker_list:
-            ticker_trades = df[df['Ticker'] == ticker]
-            
-            buy_qty = ticker_trades[ticker_trades['Type'] == 'BUY']['Qty'].sum()
-            sell_qty = ticker_trades[ticker_trades['Type'] == 'SELL']['Qty'].sum()
-            
-            buys_only = ticker_trades[ticker_trades['Type'] == 'BUY']
-            sells_only = ticker_trades[ticker_trades['Type'] == 'SELL']
-            
-            fx_rate = ticker_trades['Exchange_Rate'].iloc[0]
-            
-            # Add to cash flows
-            for _, buy in buys_only.iterrows():
-                cash_flows.append(-(buy['Qty'] * buy['Price'] * fx_rate))
-                cash_flow_dates.append(buy['Date'].date())
-            
-            for _, sell in sells_only.iterrows():
-                cash_flows.append(sell['Qty'] * sell['Price'] * fx_rate)
-                cash_flow_dates.append(sell['Date'].date())
+        # Per-trade columns computed once for the whole tradebook. Tickers are numbered
+        # in order of first appearance and valued at the exchange rate of their first trade.
+        trade_types = df['Type'].to_numpy()
+        is_buy = trade_types == 'BUY'
+        is_sell = trade_types == 'SELL'
+        ticker_codes, ticker_list = pd.factorize(df['Ticker'])
+        first_rows = np.unique(ticker_codes, return_index=True)[1]
+        fx_rates = df['Exchange_Rate'].to_numpy()[first_rows]
+        qty = df['Qty'].to_numpy(dtype=np.float64)
+        
+        buy_qty_by_ticker = np.bincount(ticker_codes, weights=np.where(is_buy, qty, 0.0), minlength=len(ticker_list))
+        sell_qty_by_ticker = np.bincount(ticker_codes, weights=np.where(is_sell, qty, 0.0), minlength=len(ticker_list))
+        # FIFO average price and realized profit of every ticker in one kernel call
+        fifo = calculate_fifo_by_ticker(df)
+        avg_prices = fifo['avg_price'].tolist()
+        realized_profits = fifo['realized_profit'].tolist()
+        
+        # Cash flows: ticker by ticker, its BUYs then its SELLs, each in tradebook order
+        cash_flows, cash_flow_dates = trade_cash_flows(df, buys_before_sells=True)
+        
+        for code, ticker in enumerate(ticker_list):
+            fx_rate = fx_rates[code]
+            buy_qty = buy_qty_by_ticker[code]
+            sell_qty = sell_qty_by_ticker[code]
             
-            # Calculate realized profit using FIFO (for ALL tickers, even fully sold)
-            if not sells_only.empty and not buys_only.empty:
-                sorted_trades = ticker_trades.sort_values('Date').reset_index(drop=True)
-                
-                buy_lots = []
-                for _, row in sorted_trades.iterrows():
-                    if row['Type'] == 'BUY':
-                        buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-                
-                for _, row in sorted_trades.iterrows():
-                    if row['Type'] == 'SELL':
-                        sell_qty_remaining = row['Qty']
-                        sell_price = row['Price']
-                        
-                        for lot in buy_lots:
-                            if sell_qty_remaining <= 0:
-                                break
-                            
-                            if lot['qty'] > 0:
-                                qty_to_match = min(lot['qty'], sell_qty_remaining)
-                                sell_revenue = qty_to_match * sell_price * fx_rate
-                                sell_cost = qty_to_match * lot['price'] * fx_rate
-                                total_realized_profit += (sell_revenue - sell_cost)
-                                lot['qty'] -= qty_to_match
-                                sell_qty_remaining -= qty_to_match
+            # Realized profit using FIFO (for ALL tickers, even fully sold)
+            total_realized_profit += realized_profits[code]
             
             current_qty = buy_qty - sell_qty
             
             # Process current holdings (for invested amount and current value)
-            if current_qty >= 0.001 and ticker in currently_held_tickers:
+            if current_qty >= 0.001 and ticker in held_tickers:
                 if ticker in market_data and market_data[ticker] is not None:
                     current_price = market_data[ticker]
                     holdings_count += 1
@@ -597,47 +856,20 @@ def calculate_portfolio_summary(df=None):
                     continue
                 
                 # Use FIFO for average price calculation
-                avg_buy_price = calculate_fifo_avg_price(ticker_trades)
+                avg_buy_price = avg_prices[code]
                 
-                invested_amt = float(current_qty) * float(avg_buy_price) * float(fx_rate)
-                current_amt = float(current_qty) * float(current_price) * float(fx_rate)
+                invested_amt = current_qty * avg_buy_price * fx_rate
+                current_amt = current_qty * current_price * fx_rate
                 
                 prev_close_price = previous_close_data.get(ticker, current_price)
-                previous_day_amt = float(current_qty) * float(prev_close_price) * float(fx_rate)
+                previous_day_amt = current_qty * prev_close_price * fx_rate
                 
                 total_invested_inr += invested_amt
                 current_value_inr += current_amt
                 previous_day_value_inr += previous_day_amt
         
-        # Add current portfolio value to cash flows
-        if current_value_inr > 0:
-            cash_flows.append(current_value_inr)
-            cash_flow_dates.append(date.today())
-        else:
-            log(f"⚠️  Current portfolio value is 0 - cannot calculate XIRR without end value")
-        
-        # Calculate XIRR
-        try:
-            if len(cash_flows) >= 2 and len(cash_flow_dates) >= 2 and current_value_inr > 0:
-                portfolio_xirr = xirr(cash_flow_dates, cash_flows)
-                if portfolio_xirr and portfolio_xirr != 0:
-                    xirr_percentage = portfolio_xirr * 100
-                    log(f"📈 XIRR calculated: {xirr_percentage:.2f}% (from {len(cash_flows)-1} transactions)")
-                else:
-                    log(f"⚠️ XIRR calculation returned {portfolio_xirr}")
-                    xirr_percentage = 0
-            else:
-                if current_value_inr <= 0:
-                    log(f"⚠️ Cannot calculate XIRR: current portfolio value is 0")
-                else:
-                    log(f"⚠️ Insufficient cash flows for XIRR: {len(cash_flows)} flows, {len(cash_flow_dates)} dates")
-                xirr_percentage = 0
-        except Exception as e:
-            log(f"⚠️ XIRR calculation error: {str(e)}")
-            import traceback
-            if ENABLE_LOGGING:
-                traceback.print_exc()
-            xirr_percentage = 0
+        # Calculate XIRR, with the current portfolio value as the final inflow
+        xirr_percentage = calculate_xirr_percentage(cash_flows, cash_flow_dates, current_value_inr)
         
         # Calculate daily change
         daily_change_inr = current_value_inr - previous_day_value_inr
@@ -664,20 +896,18 @@ def calculate_portfolio_summary(df=None):
         return None
 
 
-def calculate_detailed_portfolio(df=None, force_full_recalc=False):
+def calculate_holdings(df=None, force_full_recalc=False):
     """
-    Calculate detailed portfolio holdings with individual stock data
-    Uses year-end snapshots for optimization when available
+    Trade-derived part of the detailed portfolio: everything that depends only on the
+    tradebook (and snapshots), not on live prices. Uses year-end snapshots when available.
     
     Args:
         df: Optional pre-loaded dataframe
         force_full_recalc: If True, ignore snapshots and process full tradebook
     
-    Returns a tuple of (portfolio_rows, summary_metrics, df)
-    
-    portfolio_rows: List of dictionaries with detailed holdings data
-    summary_metrics: Dictionary with portfolio-level metrics
-    df: The loaded dataframe (for trade book display)
+    Returns a dictionary with holdings (per-ticker qty, avg price, FX, ...),
+    currently_held_tickers, cash_flows and cash_flow_dates (NumPy arrays), realized_profit
+    and df (the loaded tradebook), or None on error
     """
     try:
         # Load data with snapshot optimization
@@ -695,9 +925,7 @@ def calculate_detailed_portfolio(df=None, force_full_recalc=False):
         # Use snapshot + incremental if available, otherwise use full tradebook
         use_snapshot = snapshot_df is not None and not force_full_recalc
         
-        # Initialize cash flows
-        cash_flows = []
-        cash_flow_dates = []
+        # Cash flows are built as NumPy arrays by each branch below
         total_realized_profit = 0.0
         
         if use_snapshot:
@@ -716,18 +944,17 @@ def calculate_detailed_portfolio(df=None, force_full_recalc=False):
             # IMPORTANT: This includes tickers that were fully sold by snapshot date
             # but may have been rebought after the snapshot
             realized_profit_from_fully_sold = 0.0
-            all_tickers = full_df['Ticker'].unique()
             
             # Get snapshot date
             snapshot_date = pd.Timestamp(f'{snapshot_year}-12-31 23:59:59')
             
-            for ticker in all_tickers:
+            for ticker, ticker_trades in full_df.groupby('Ticker', sort=False, observed=True):
                 # Skip tickers that are still held (already counted above)
                 if ticker in holdings:
                     continue
                 
                 # This ticker is not in snapshot - check if it had any sells
-                ticker_trades = full_df[full_df['Ticker'] == ticker].sort_values('Date')
+                ticker_trades = ticker_trades.sort_values('Date')
                 
                 has_sells = (ticker_trades['Type'] == 'SELL').any()
                 if not has_sells:
@@ -750,28 +977,7 @@ def calculate_detailed_portfolio(df=None, force_full_recalc=False):
                 # Calculate realized profit using FIFO for all historical sells
                 # (only process trades up to snapshot date, not rebought trades)
                 fx_rate = ticker_trades['Exchange_Rate'].iloc[0]
-                buy_lots = []
-                
-                for _, row in trades_up_to_snapshot.iterrows():
-                    if row['Type'] == 'BUY':
-                        buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-                
-                for _, row in trades_up_to_snapshot.iterrows():
-                    if row['Type'] == 'SELL':
-                        sell_qty_remaining = row['Qty']
-                        sell_price = row['Price']
-                        
-                        for lot in buy_lots:
-                            if sell_qty_remaining <= 0:
-                                break
-                            
-                            if lot['qty'] > 0:
-                                qty_to_match = min(lot['qty'], sell_qty_remaining)
-                                sell_revenue = qty_to_match * sell_price * fx_rate
-                                sell_cost = qty_to_match * lot['price'] * fx_rate
-                                realized_profit_from_fully_sold += (sell_revenue - sell_cost)
-                                lot['qty'] -= qty_to_match
-                                sell_qty_remaining -= qty_to_match
+                realized_profit_from_fully_sold += calculate_fifo_realized_profit(trades_up_to_snapshot, fx_rate)
             
             total_realized_profit = total_realized_profit_from_holdings + realized_profit_from_fully_sold
             
@@ -783,115 +989,69 @@ def calculate_detailed_portfolio(df=None, force_full_recalc=False):
             # Use cash flows from snapshot if available
             if snapshot_cash_flows and snapshot_cash_flow_dates:
                 log("💰 Using cached cash flows from snapshot for XIRR")
-                cash_flows = list(snapshot_cash_flows)
-                cash_flow_dates = list(snapshot_cash_flow_dates)
+                cash_flows = np.asarray(snapshot_cash_flows, dtype=np.float64)
+                cash_flow_dates = np.asarray(snapshot_cash_flow_dates, dtype='datetime64[D]')
                 log(f"   Snapshot cash flows: {len(cash_flows)} transactions")
-                log(f"   Date range: {min(cash_flow_dates)} to {max(cash_flow_dates)}")
-                log(f"   Total cash out (investments): ₹{sum(cf for cf in cash_flows if cf < 0):,.2f}")
-                log(f"   Total cash in (returns): ₹{sum(cf for cf in cash_flows if cf > 0):,.2f}")
+                log(f"   Date range: {cash_flow_dates.min()} to {cash_flow_dates.max()}")
+                log(f"   Total cash out (investments): ₹{cash_flows[cash_flows < 0].sum():,.2f}")
+                log(f"   Total cash in (returns): ₹{cash_flows[cash_flows > 0].sum():,.2f}")
                 
                 # Add incremental cash flows (trades after snapshot)
-                incremental_count = 0
-                if not calc_df.empty:
-                    for ticker in calc_df['Ticker'].unique():
-                        ticker_trades = calc_df[calc_df['Ticker'] == ticker]
-                        fx_rate = ticker_trades['Exchange_Rate'].iloc[0]
-                        
-                        for _, trade in ticker_trades.iterrows():
-                            if trade['Type'] == 'BUY':
-                                cash_flows.append(-(trade['Qty'] * trade['Price'] * fx_rate))
-                                cash_flow_dates.append(trade['Date'].date())
-                                incremental_count += 1
-                            elif trade['Type'] == 'SELL':
-                                cash_flows.append(trade['Qty'] * trade['Price'] * fx_rate)
-                                cash_flow_dates.append(trade['Date'].date())
-                                incremental_count += 1
-                    if incremental_count > 0:
-                        log(f"   Added {incremental_count} incremental cash flows")
+                incremental_flows, incremental_dates = trade_cash_flows(calc_df)
+                cash_flows = np.concatenate([cash_flows, incremental_flows])
+                cash_flow_dates = np.concatenate([cash_flow_dates, incremental_dates])
+                if len(incremental_flows) > 0:
+                    log(f"   Added {len(incremental_flows)} incremental cash flows")
             else:
                 # Fallback: Calculate from full tradebook if cash flows not in snapshot
                 log("⚠️  Snapshot doesn't have cash flows - calculating from full tradebook")
-                for ticker in full_df['Ticker'].unique():
-                    ticker_trades = full_df[full_df['Ticker'] == ticker]
-                    fx_rate = ticker_trades['Exchange_Rate'].iloc[0]
-                    
-                    for _, trade in ticker_trades.iterrows():
-                        if trade['Type'] == 'BUY':
-                            cash_flows.append(-(trade['Qty'] * trade['Price'] * fx_rate))
-                            cash_flow_dates.append(trade['Date'].date())
-                        elif trade['Type'] == 'SELL':
-                            cash_flows.append(trade['Qty'] * trade['Price'] * fx_rate)
-                            cash_flow_dates.append(trade['Date'].date())
+                cash_flows, cash_flow_dates = trade_cash_flows(full_df)
         else:
             # Legacy calculation: process full tradebook
             holdings = {}
             currently_held_tickers_set = set(get_currently_held_tickers(calc_df))
             currently_held_tickers = list(currently_held_tickers_set)
             
-            ticker_list = calc_df['Ticker'].unique().tolist()
+            # Buy/sell quantity and trade count of every ticker from one aggregation,
+            # and each ticker's first trade for its FX rate, currency and SGB flag
+            trade_totals = calc_df.groupby(['Ticker', 'Type'], observed=True)['Qty'].agg(['sum', 'size'])
+            trade_totals = trade_totals.unstack('Type', fill_value=0)
+            qty_by_type = trade_totals['sum'].reindex(columns=['BUY', 'SELL'], fill_value=0.0)
+            count_by_type = trade_totals['size'].reindex(columns=['BUY', 'SELL'], fill_value=0)
+            current_qty_by_ticker = (qty_by_type['BUY'] - qty_by_type['SELL']).to_dict()
+            has_buys_and_sells = ((count_by_type['BUY'] > 0) & (count_by_type['SELL'] > 0)).to_dict()
+            first_trades = calc_df.drop_duplicates('Ticker').set_index('Ticker')
+            # FIFO average price and realized profit of every ticker in one kernel call
+            fifo = calculate_fifo_by_ticker(calc_df)
             
-            for ticker in ticker_list:
-                ticker_trades = calc_df[calc_df['Ticker'] == ticker]
+            for ticker in fifo.index:
+                current_qty = current_qty_by_ticker[ticker]
+                is_held = current_qty >= 0.02
                 
-                buy_qty = ticker_trades[ticker_trades['Type'] == 'BUY']['Qty'].sum()
-                sell_qty = ticker_trades[ticker_trades['Type'] == 'SELL']['Qty'].sum()
-                current_qty = buy_qty - sell_qty
-                
-                buys_only = ticker_trades[ticker_trades['Type'] == 'BUY']
-                sells_only = ticker_trades[ticker_trades['Type'] == 'SELL']
+                # Fully sold tickers without both buys and sells have nothing to add
+                if not is_held and not has_buys_and_sells[ticker]:
+                    continue
                 
-                fx_rate = ticker_trades['Exchange_Rate'].iloc[0]
-                currency = ticker_trades['Currency'].iloc[0]
-                is_sgb = ticker_trades['Is_SGB'].iloc[0] if 'Is_SGB' in ticker_trades.columns else False
+                fx_rate = first_trades.at[ticker, 'Exchange_Rate']
                 
-                # Calculate realized profit using FIFO (for ALL tickers, even fully sold)
+                # Realized profit using FIFO (for ALL tickers, even fully sold)
                 realized_profit = 0.0
-                if not sells_only.empty and not buys_only.empty:
-                    sorted_trades = ticker_trades.sort_values('Date').reset_index(drop=True)
-                    
-                    buy_lots = []
-                    for _, row in sorted_trades.iterrows():
-                        if row['Type'] == 'BUY':
-                            buy_lots.append({'qty': row['Qty'], 'price': row['Price']})
-                    
-                    for _, row in sorted_trades.iterrows():
-                        if row['Type'] == 'SELL':
-                            sell_qty_remaining = row['Qty']
-                            sell_price = row['Price']
-                            
-                            for lot in buy_lots:
-                                if sell_qty_remaining <= 0:
-                                    break
-                                    
-                                if lot['qty'] > 0:
-                                    qty_to_match = min(lot['qty'], sell_qty_remaining)
-                                    
-                                    sell_revenue = qty_to_match * sell_price * fx_rate
-                                    sell_cost = qty_to_match * lot['price'] * fx_rate
-                                    realized_profit += (sell_revenue - sell_cost)
-                                    
-                                    lot['qty'] -= qty_to_match
-                                    sell_qty_remaining -= qty_to_match
+                if has_buys_and_sells[ticker]:
+                    realized_profit = float(fifo.at[ticker, 'realized_profit'])
                 
                 # Add realized profit to total (even if ticker is fully sold)
                 total_realized_profit += realized_profit
                 
                 # Skip adding to holdings if fully sold
-                if current_qty < 0.02:
+                if not is_held:
                     continue
                 
-                # Add to cash flows (only for current holdings for XIRR calculation)
-                for _, buy in buys_only.iterrows():
-                    cash_flows.append(-(buy['Qty'] * buy['Price'] * fx_rate))
-                    cash_flow_dates.append(buy['Date'].date())
-                
-                for _, sell in sells_only.iterrows():
-                    cash_flows.append(sell['Qty'] * sell['Price'] * fx_rate)
-                    cash_flow_dates.append(sell['Date'].date())
+                currency = first_trades.at[ticker, 'Currency']
+                is_sgb = first_trades.at[ticker, 'Is_SGB'] if 'Is_SGB' in first_trades.columns else False
                 
-                # Calculate FIFO average price
-                avg_buy_price = calculate_fifo_avg_price(ticker_trades)
-                invested_amt_inr = float(current_qty) * float(avg_buy_price) * float(fx_rate)
+                # FIFO average price
+                avg_buy_price = float(fifo.at[ticker, 'avg_price'])
+                invested_amt_inr = current_qty * avg_buy_price * fx_rate
                 
                 holdings[ticker] = {
                     'qty': current_qty,
@@ -902,131 +1062,155 @@ def calculate_detailed_portfolio(df=None, force_full_recalc=False):
                     'fx_rate': fx_rate,
                     'is_sgb': is_sgb
                 }
-        
-        if not currently_held_tickers:
-            return [], None, full_df
-        
-        # Get market data ONCE
-        market_data, company_names, previous_close_data = get_market_data(full_df, currently_held_tickers)
-        
-        # Calculate portfolio metrics
-        total_invested_inr = 0.0
-        current_value_inr = 0.0
-        previous_day_value_inr = 0.0
-        holdings_count = 0
-        portfolio_rows = []
-        
-        for ticker in currently_held_tickers:
-            if ticker not in holdings:
-                continue
-            
-            holding = holdings[ticker]
-            current_qty = holding['qty']
-            avg_buy_price = holding['avg_price']
-            fx_rate = holding['fx_rate']
-            currency = holding['currency']
             
-            # Calculate invested amount (always available)
-            invested_amt = float(current_qty) * float(avg_buy_price) * float(fx_rate)
-            total_invested_inr += invested_amt
-            
-            # Check if we have current price data
-            if ticker not in market_data or market_data[ticker] is None:
-                # Missing price - use NaN for current values but still show the holding
-                log(f"⚠️ Skipping P/L calculation for {ticker} due to missing price data")
-                portfolio_rows.append({
-                    "Ticker": ticker,
-                    "Name": company_names.get(ticker, ticker),
-                    "Qty": round(current_qty, 2),
-                    "Avg Buy Price": round(avg_buy_price, 2),
-                    "Current Price": float('nan'),
-                    "Currency": currency,
-                    "Invested Value (INR)": round(invested_amt, 2),
-                    "Current Value (INR)": float('nan'),
-                    "P&L (INR)": float('nan'),
-                    "P/L %": float('nan')
-                })
-                continue
-            
-            # We have price data - calculate everything
-            current_price = market_data[ticker]
-            holdings_count += 1
-            
-            current_amt = float(current_qty) * float(current_price) * float(fx_rate)
-            
-            prev_close_price = previous_close_data.get(ticker, current_price)
-            previous_day_amt = float(current_qty) * float(prev_close_price) * float(fx_rate)
-            
-            pl_amt = current_amt - invested_amt
-            pl_percentage = ((current_amt - invested_amt) / invested_amt) * 100 if invested_amt > 0 else 0
-            
-            current_value_inr += current_amt
-            previous_day_value_inr += previous_day_amt
-            
-            # Add to portfolio rows for display
-            portfolio_rows.append({
-                "Ticker": ticker,
-                "Name": company_names.get(ticker, ticker),
-                "Qty": round(current_qty, 2),
-                "Avg Buy Price": round(avg_buy_price, 2),
-                "Current Price": round(current_price, 2),
-                "Currency": currency,
-                "Invested Value (INR)": round(invested_amt, 2),
-                "Current Value (INR)": round(current_amt, 2),
-                "P&L (INR)": round(pl_amt, 2),
-                "P/L %": round(pl_percentage, 2)
-            })
-        
-        # Add current portfolio value to cash flows
-        if current_value_inr > 0:
-            cash_flows.append(current_value_inr)
-            cash_flow_dates.append(date.today())
-        else:
-            log(f"⚠️  Current portfolio value is 0 - cannot calculate XIRR without end value")
-        
-        # Calculate XIRR
-        try:
-            if len(cash_flows) >= 2 and len(cash_flow_dates) >= 2 and current_value_inr > 0:
-                portfolio_xirr = xirr(cash_flow_dates, cash_flows)
-                if portfolio_xirr and portfolio_xirr != 0:
-                    xirr_percentage = portfolio_xirr * 100
-                    log(f"📈 XIRR calculated: {xirr_percentage:.2f}% (from {len(cash_flows)-1} transactions)")
-                else:
-                    log(f"⚠️ XIRR calculation returned {portfolio_xirr}")
-                    xirr_percentage = 0
-            else:
-                if current_value_inr <= 0:
-                    log(f"⚠️ Cannot calculate XIRR: current portfolio value is 0")
-                else:
-                    log(f"⚠️ Insufficient cash flows for XIRR: {len(cash_flows)} flows, {len(cash_flow_dates)} dates")
-                xirr_percentage = 0
-        except Exception as e:
-            log(f"⚠️ XIRR calculation error: {str(e)}")
-            import traceback
-            if ENABLE_LOGGING:
-                traceback.print_exc()
-            xirr_percentage = 0
-        
-        # Calculate daily change
-        daily_change_inr = current_value_inr - previous_day_value_inr
-        daily_change_pct = ((current_value_inr - previous_day_value_inr) / previous_day_value_inr) * 100 if previous_day_value_inr > 0 else 0
-        
-        # Calculate unrealized P&L
-        total_unrealized_pl = current_value_inr - total_invested_inr
-        unrealized_pl_pct = (total_unrealized_pl / total_invested_inr) * 100 if total_invested_inr > 0 else 0
+            # Cash flows of current holdings only (for XIRR calculation)
+            cash_flows, cash_flow_dates = trade_cash_flows(calc_df, buys_before_sells=True, tickers=holdings)
         
-        summary_metrics = {
-            'total_invested': total_invested_inr,
-            'current_value': current_value_inr,
-            'unrealized_pl': total_unrealized_pl,
-            'unrealized_pl_pct': unrealized_pl_pct,
+        return {
+            'holdings': holdings,
+            'currently_held_tickers': currently_held_tickers,
+            'cash_flows': cash_flows,
+            'cash_flow_dates': cash_flow_dates,
             'realized_profit': total_realized_profit,
-            'daily_change': daily_change_inr,
-            'daily_change_pct': daily_change_pct,
-            'xirr': xirr_percentage,
-            'holdings_count': holdings_count
+            'df': full_df
         }
         
+    except Exception as e:
+        log(f"❌ Error calculating holdings: {str(e)}")
+        import traceback
+        if ENABLE_LOGGING:
+            traceback.print_exc()
+        return None
+
+
+def build_portfolio_table(holdings_data, market_data, company_names, previous_close_data):
+    """
+    Price-dependent part of the detailed portfolio: values the holdings from
+    calculate_holdings() at the given market prices.
+    The holdings table is computed column by column with NumPy, not row by row.
+    
+    Returns a tuple of (portfolio_df, summary_metrics)
+    """
+    holdings = holdings_data['holdings']
+    cash_flows = holdings_data['cash_flows']
+    cash_flow_dates = holdings_data['cash_flow_dates']
+    total_realized_profit = holdings_data['realized_profit']
+    
+    tickers = [ticker for ticker in holdings_data['currently_held_tickers'] if ticker in holdings]
+    qty = np.array([holdings[ticker]['qty'] for ticker in tickers], dtype=np.float64)
+    avg_buy_price = np.array([holdings[ticker]['avg_price'] for ticker in tickers], dtype=np.float64)
+    fx_rate = np.array([holdings[ticker]['fx_rate'] for ticker in tickers], dtype=np.float64)
+    
+    # Missing prices (None) become NaN, so the holding is still shown with its invested amount
+    has_price = np.array([market_data.get(ticker) is not None for ticker in tickers], dtype=bool)
+    current_price = np.array([market_data.get(ticker) for ticker in tickers], dtype=np.float64)
+    prev_close_price = np.array(
+        [previous_close_data.get(ticker, market_data.get(ticker)) for ticker in tickers], dtype=np.float64
+    )
+    
+    for ticker in np.array(tickers, dtype=object)[~has_price]:
+        log(f"⚠️ Skipping P/L calculation for {ticker} due to missing price data")
+    
+    # Calculate invested amount (always available) and current values
+    invested_amt = qty * avg_buy_price * fx_rate
+    current_amt = np.where(has_price, qty * current_price * fx_rate, np.nan)
+    previous_day_amt = qty * prev_close_price * fx_rate
+    pl_amt = current_amt - invested_amt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pl_percentage = np.where(
+            has_price,
+            np.where(invested_amt > 0, ((current_amt - invested_amt) / invested_amt) * 100, 0),
+            np.nan
+        )
+    
+    # Calculate portfolio metrics (summed in holding order, as the per-row totals were)
+    total_invested_inr = sum(invested_amt.tolist(), 0.0)
+    current_value_inr = sum(current_amt[has_price].tolist(), 0.0)
+    previous_day_value_inr = sum(previous_day_amt[has_price].tolist(), 0.0)
+    holdings_count = int(has_price.sum())
+    
+    portfolio_df = pd.DataFrame({
+        "Ticker": tickers,
+        "Name": [company_names.get(ticker, ticker) for ticker in tickers],
+        "Qty": np.round(qty, 2),
+        "Avg Buy Price": np.round(avg_buy_price, 2),
+        "Current Price": np.round(current_price, 2),
+        "Currency": [holdings[ticker]['currency'] for ticker in tickers],
+        "Invested Value (INR)": np.round(invested_amt, 2),
+        "Current Value (INR)": np.round(current_amt, 2),
+        "P&L (INR)": np.round(pl_amt, 2),
+        "P/L %": np.round(pl_percentage, 2)
+    })
+    
+    # Calculate XIRR, with the current portfolio value as the final inflow
+    xirr_percentage = calculate_xirr_percentage(cash_flows, cash_flow_dates, current_value_inr)
+    
+    # Calculate daily change
+    daily_change_inr = current_value_inr - previous_day_value_inr
+    daily_change_pct = ((current_value_inr - previous_day_value_inr) / previous_day_value_inr) * 100 if previous_day_value_inr > 0 else 0
+    
+    # Calculate unrealized P&L
+    total_unrealized_pl = current_value_inr - total_invested_inr
+    unrealized_pl_pct = (total_unrealized_pl / total_invested_inr) * 100 if total_invested_inr > 0 else 0
+    
+    summary_metrics = {
+        'total_invested': total_invested_inr,
+        'current_value': current_value_inr,
+        'unrealized_pl': total_unrealized_pl,
+        'unrealized_pl_pct': unrealized_pl_pct,
+        'realized_profit': total_realized_profit,
+        'daily_change': daily_change_inr,
+        'daily_change_pct': daily_change_pct,
+        'xirr': xirr_percentage,
+        'holdings_count': holdings_count
+    }
+    
+    return portfolio_df, summary_metrics
+
+
+def build_portfolio_rows(holdings_data, market_data, company_names, previous_close_data):
+    """
+    Same as build_portfolio_table, with the holdings as a list of row dictionaries
+
+    Returns a tuple of (portfolio_rows, summary_metrics)
+    """
+    portfolio_df, summary_metrics = build_portfolio_table(
+        holdings_data, market_data, company_names, previous_close_data
+    )
+    return portfolio_df.to_dict('records'), summary_metrics
+
+
+def calculate_detailed_portfolio(df=None, force_full_recalc=False):
+    """
+    Calculate detailed portfolio holdings with individual stock data
+    Uses year-end snapshots for optimization when available
+    
+    Args:
+        df: Optional pre-loaded dataframe
+        force_full_recalc: If True, ignore snapshots and process full tradebook
+    
+    Returns a tuple of (portfolio_rows, summary_metrics, df)
+    
+    portfolio_rows: List of dictionaries with detailed holdings data
+    summary_metrics: Dictionary with portfolio-level metrics
+    df: The loaded dataframe (for trade book display)
+    """
+    holdings_data = calculate_holdings(df, force_full_recalc)
+    if holdings_data is None:
+        return [], None, None
+    
+    full_df = holdings_data['df']
+    currently_held_tickers = holdings_data['currently_held_tickers']
+    if not currently_held_tickers:
+        return [], None, full_df
+    
+    try:
+        # Get market data ONCE
+        market_data, company_names, previous_close_data = get_market_data(full_df, currently_held_tickers)
+        
+        portfolio_rows, summary_metrics = build_portfolio_rows(
+            holdings_data, market_data, company_names, previous_close_data
+        )
         return portfolio_rows, summary_metrics, full_df
         
     except Exception as e:
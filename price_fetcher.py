@@ -14,7 +14,9 @@ import pandas as pd
 import os
 import warnings
 import logging
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 
 # Suppress warnings
@@ -35,6 +37,12 @@ def log(message):
 
 # Default backup prices file path
 BACKUP_PRICES_FILE = 'archivesCSV/backupPrices.csv'
+YF_INFO_MAX_WORKERS = 8  # Concurrent yfinance info requests for company names
+UNAVAILABLE_RETRY_SECONDS = 3600  # Skip yfinance this long for tickers it had no data for
+
+# Tickers yfinance answered with no price data -> time of that answer. Known-bad
+# symbols go straight to the backup prices instead of being re-fetched every rerun.
+_unavailable_tickers = {}
 
 
 # ============================================================================
@@ -63,28 +71,23 @@ def load_backup_prices(backup_csv_path=BACKUP_PRICES_FILE):
         # Check which format we're dealing with
         if 'Closing Price' in backup_df.columns:
             # New format: Ticker, Date, Closing Price
-            for ticker in backup_df['Ticker'].unique():
-                ticker_rows = backup_df[backup_df['Ticker'] == ticker]
-                # Get rows with valid prices
-                valid_prices = ticker_rows[ticker_rows['Closing Price'].notna()]
-                if not valid_prices.empty:
-                    # Sort by date (most recent first)
-                    if 'Date' in valid_prices.columns:
-                        valid_prices = valid_prices.sort_values('Date', ascending=False)
-                        # Remove duplicate dates - keep first (most recent) occurrence
-                        valid_prices = valid_prices.drop_duplicates(subset='Date', keep='first')
-                    
-                    # Get most recent price
-                    price = float(valid_prices.iloc[0]['Closing Price'])
-                    current_prices[ticker] = price
-                    
-                    # Get previous close (second most recent unique date)
-                    if len(valid_prices) >= 2:
-                        prev_price = float(valid_prices.iloc[1]['Closing Price'])
-                        prev_prices[ticker] = prev_price
-                    else:
-                        # No previous price available, use current as previous
-                        prev_prices[ticker] = price
+            # Get rows with valid prices
+            valid_prices = backup_df[backup_df['Closing Price'].notna()]
+            if 'Date' in valid_prices.columns:
+                # Sort each ticker's rows by date (most recent first), in one sort
+                valid_prices = valid_prices.sort_values(['Ticker', 'Date'], ascending=[True, False], kind='stable')
+                # Remove duplicate dates - keep first (most recent) occurrence
+                valid_prices = valid_prices.drop_duplicates(subset=['Ticker', 'Date'], keep='first')
+            
+            # Position of each row within its ticker: 0 = most recent, 1 = previous close
+            position = valid_prices.groupby('Ticker', sort=False).cumcount()
+            latest = valid_prices[position == 0]
+            previous = valid_prices[position == 1]
+            
+            current_prices = dict(zip(latest['Ticker'], latest['Closing Price'].astype(float).tolist()))
+            # No previous price available: use current as previous
+            prev_prices = dict(current_prices)
+            prev_prices.update(zip(previous['Ticker'], previous['Closing Price'].astype(float).tolist()))
         
         elif 'Current Price' in backup_df.columns:
             # Old format: Ticker, Current Price (no date info)
@@ -276,6 +279,70 @@ def fetch_price_from_yfinance(ticker, target_date=None):
         return None, None, None
 
 
+def fetch_company_name(ticker):
+    """Company name of a ticker from yfinance info, or the ticker itself if unavailable"""
+    try:
+        import yfinance as yf
+        info = yf.Ticker(ticker).info
+        return info.get('longName') or info.get('shortName') or ticker
+    except Exception:
+        return ticker
+
+
+def fetch_prices_from_yfinance_batch(tickers):
+    """
+    Fetch current prices for several tickers with one yfinance download,
+    and their company names concurrently
+    
+    Args:
+        tickers: List of stock ticker symbols
+        
+    Returns:
+        Dict of ticker -> (price, company_name, previous_close) for the tickers
+        that got a price; tickers left out should go through fetch_price_with_fallback
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    
+    try:
+        import yfinance as yf
+        data = yf.download(tickers, period="5d", progress=False, threads=True, auto_adjust=False)
+    except Exception as e:
+        log(f"⚠️ Batch yfinance download failed: {e}")
+        return {}
+    
+    if data is None or data.empty or 'Close' not in data.columns.get_level_values(0):
+        return {}
+    
+    closes = data['Close']
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+    
+    prices = {}
+    for ticker in tickers:
+        if ticker not in closes.columns:
+            continue
+        ticker_closes = closes[ticker].dropna()
+        if ticker_closes.empty:
+            continue
+        price = float(ticker_closes.iloc[-1])
+        prev_close = float(ticker_closes.iloc[-2]) if len(ticker_closes) >= 2 else price
+        prices[ticker] = (price, prev_close)
+    
+    if not prices:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=YF_INFO_MAX_WORKERS) as executor:
+        names = dict(zip(prices, executor.map(fetch_company_name, prices)))
+    
+    log(f"✅ Fetched {len(prices)}/{len(tickers)} prices from yfinance in one batch")
+    return {
+        ticker: (price, names[ticker], prev_close)
+        for ticker, (price, prev_close) in prices.items()
+    }
+
+
 # ============================================================================
 # PRICE FETCHING - NSE (SGBs)
 # ============================================================================
@@ -303,13 +370,14 @@ def fetch_sgb_price(ticker):
         resp.raise_for_status()
 
         data = resp.json()
-        if data and isinstance(data, dict) and 'priceInfo' in data:
-            price = data['priceInfo'].get('lastPrice') or data['priceInfo'].get('close')
+        price_info = data.get('priceInfo') if isinstance(data, dict) else None
+        if isinstance(price_info, dict):
+            price = price_info.get('lastPrice') or price_info.get('close')
             if price is not None:
                 price_f = float(price)
                 log(f"✅ Fetched {ticker} (SGB) from NSE: ₹{price_f:.2f}")
                 return price_f
-    except Exception as e:
+    except (requests.RequestException, ValueError, TypeError) as e:
         log(f"⚠️ Error fetching SGB price for {ticker} from NSE: {e}")
 
     return None
@@ -360,8 +428,15 @@ def fetch_price_with_fallback(ticker, is_sgb=False, backup_csv_path=BACKUP_PRICE
                 log(f"❌ ERROR: Could not fetch {ticker} (SGB) from NSE and no backup price available")
                 return None, f"{ticker} (SGB - Price N/A)", None, 'unavailable'
     else:
-        # Fetch from yfinance for regular stocks/MFs
-        price, company_name, prev_close = fetch_price_from_yfinance(ticker)
+        # Fetch from yfinance for regular stocks/MFs, unless it recently had no data for this ticker
+        checked_at = _unavailable_tickers.get(ticker)
+        if checked_at is not None and time.time() - checked_at < UNAVAILABLE_RETRY_SECONDS:
+            price, company_name, prev_close = None, ticker, None
+        else:
+            price, company_name, prev_close = fetch_price_from_yfinance(ticker)
+            if price is None and company_name is not None:
+                # yfinance answered but has no price for it (a failed request returns no name)
+                _unavailable_tickers[ticker] = time.time()
         
         if price == 'RATE_LIMITED':
             # Rate limited - try backup
@@ -119,6 +119,7 @@ def main():
     
     files_to_remove = [
         'archivesCSV/tradebook.csv',
+        'archivesCSV/tradebook.parquet',
         'archivesCSV/tradebook_processed_files.json'
     ]
     